@@ -0,0 +1,137 @@
+import argparse
+import itertools
+import time
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from chess_cli import Chess
+from evaluation import MG_TABLES, EG_TABLES, PHASE_WEIGHTS, MAX_PHASE
+from utils import SQUARES
+
+# plane order follows the bitboard index (side * 6 + kind)
+SYMBOLS = "PNBRQKpnbrqk"
+_SYMBOL_CODES = np.frombuffer(SYMBOLS.encode("ascii"), dtype=np.uint8)
+# digits of a FEN piece placement and the run of empty squares they stand for
+_EMPTY_RUNS = [(str(n), "1" * n) for n in range(2, 9)]
+
+# WEIGHTS[plane * 64 + square] = (middlegame, endgame, phase) contribution of a piece on that square.
+# float32 so that the sums go through BLAS, they stay far below 2 ** 24 and are exact.
+WEIGHTS = np.stack([
+    np.array(MG_TABLES, dtype=np.float32).reshape(768),
+    np.array(EG_TABLES, dtype=np.float32).reshape(768),
+    np.repeat(np.array(PHASE_WEIGHTS * 2, dtype=np.float32), 64),
+], axis=1)
+
+
+class PositionBatch(NamedTuple):
+    """
+    N positions as arrays: planes[n, index, row, col] is 1 where the piece of that bitboard index
+    stands (a8 is row 0, col 0), castling[n] holds the K Q k q rights and ep_square[n] is -1 without
+    an en passant square.
+    """
+    planes: np.ndarray  # N x 12 x 8 x 8, uint8
+    turn: np.ndarray  # N, uint8, 0 white 1 black
+    castling: np.ndarray  # N x 4, uint8
+    ep_square: np.ndarray  # N, int8
+
+    def __len__(self) -> int:
+        return len(self.turn)
+
+
+def _castling_bits(masks: list[int]) -> np.ndarray:
+    return (np.array(masks, dtype=np.uint8)[:, None] >> np.arange(4, dtype=np.uint8)) & 1
+
+
+def encode_positions(positions: Iterable[Chess]) -> PositionBatch:
+    """
+    Export Chess positions, the planes are unpacked straight from the bitboards.
+    """
+    positions = list(positions)
+    bitboards = np.array([chess.board.bitboards for chess in positions], dtype="<u8").reshape(-1, 12)
+    # bit n of a little endian bitboard is bit n % 8 of byte n // 8
+    planes = np.unpackbits(bitboards.view(np.uint8), axis=1, bitorder="little")
+    return PositionBatch(
+        planes.reshape(-1, 12, 8, 8),
+        np.array([chess.turn for chess in positions], dtype=np.uint8),
+        _castling_bits([chess.castling for chess in positions]).reshape(-1, 4),
+        np.array([-1 if chess.ep_square is None else chess.ep_square for chess in positions], dtype=np.int8),
+    )
+
+
+def encode_fens(fens: Iterable[str]) -> PositionBatch:
+    """
+    Encode FENs (or EPD lines, only the first four fields are read) without building a Chess
+    for each of them: the placements are expanded to 64 characters and compared with the
+    piece symbols all at once.
+    """
+    placements, turns, castlings, ep_squares = [], [], [], []
+    for fen in fens:
+        placement, turn, castling, enpassant = fen.split(maxsplit=4)[:4]
+        # str.replace is much faster than str.translate with multi-character replacements
+        squares = placement.replace("/", "")
+        for digit, run in _EMPTY_RUNS:
+            squares = squares.replace(digit, run)
+        if len(squares) != 64:
+            raise ValueError(f"Invalid piece placement: {fen}")
+        placements.append(squares)
+        turns.append(turn == "b")
+        castlings.append(("K" in castling) | ("Q" in castling) << 1 | ("k" in castling) << 2 | ("q" in castling) << 3)
+        ep_squares.append(SQUARES.get(enpassant, -1))
+
+    codes = np.frombuffer("".join(placements).encode("ascii"), dtype=np.uint8).reshape(-1, 64)
+    planes = codes[:, None, :] == _SYMBOL_CODES[None, :, None]
+    return PositionBatch(
+        planes.view(np.uint8).reshape(-1, 12, 8, 8),
+        np.array(turns, dtype=np.uint8),
+        _castling_bits(castlings).reshape(-1, 4),
+        np.array(ep_squares, dtype=np.int8),
+    )
+
+
+def evaluate_batch(batch: PositionBatch, chunk_size: int = 65536) -> np.ndarray:
+    """
+    The tapered evaluation of evaluation.py for every position of the batch, in centipawns from
+    the point of view of the side to move. Equals Chess.evaluate() position by position.
+    """
+    planes = batch.planes.reshape(len(batch), 768)
+    terms = np.empty((len(batch), 3), dtype=np.int64)
+    # chunks bound the float copy of the planes
+    for start in range(0, len(batch), chunk_size):
+        chunk = planes[start:start + chunk_size].astype(np.float32)
+        terms[start:start + chunk_size] = np.rint(chunk @ WEIGHTS)
+
+    mg_score, eg_score, phase = terms.T
+    phase = np.minimum(phase, MAX_PHASE)
+    scores = (mg_score * phase + eg_score * (MAX_PHASE - phase)) // MAX_PHASE
+    return np.where(batch.turn == 0, scores, -scores)
+
+
+def score_fens(fens: Iterable[str], chunk_size: int = 65536) -> np.ndarray:
+    """
+    Evaluate any number of FENs, encoded `chunk_size` at a time so that the planes of only
+    one chunk are in memory.
+    """
+    fens = iter(fens)
+    scores = []
+    while chunk := list(itertools.islice(fens, chunk_size)):
+        scores.append(evaluate_batch(encode_fens(chunk), chunk_size))
+    return np.concatenate(scores) if scores else np.empty(0, dtype=np.int64)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a file of FENs or EPD lines in batches.")
+    parser.add_argument("path", help="one position per line")
+    parser.add_argument("-o", "--output", help="save the scores to this .npy file")
+    parser.add_argument("--chunk-size", type=int, default=65536, help="positions encoded at a time")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.path) as file:
+        scores = score_fens((line for line in file if line.strip() and not line.startswith("#")), args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"{len(scores)} positions in {elapsed:.2f}s ({int(len(scores) / elapsed) if elapsed else 0} positions/s)")
+    if args.output:
+        np.save(args.output, scores)
+    else:
+        print(scores)
@@ -0,0 +1,133 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import time
+
+from chess_cli import Chess, START_FEN
+from perft import count_nodes
+from regression import TESTS_DIR, parse_golden
+
+# tactical middlegames, rich in checks, pins, captures, castling and en passant
+MIDDLEGAMES = {
+    "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "position4": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "position5": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "position6": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+}
+
+PHASES = ["construct", "make_undo", "get_attacked_squares", "get_possible_moves", "capture_moves", "perft"]
+
+
+def benchmark_positions() -> dict[str, str]:
+    """
+    The fixed set of positions: the start position, the FENs in tests/ and the middlegames.
+    """
+    positions = {"start": START_FEN}
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, "*.txt"))):
+        positions[os.path.basename(path)] = parse_golden(path)[0]
+    positions.update(MIDDLEGAMES)
+    return positions
+
+
+def best_time(function, number: int, repeat: int) -> float:
+    """
+    Seconds per call of `function`, the best of `repeat` runs of `number` calls.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def benchmark_position(fen: str, number: int, repeat: int, perft_depth: int) -> dict[str, float]:
+    """
+    Microseconds per operation of every phase on one position. make_undo is the time of one
+    make_move/undo_move pair averaged over the legal moves, get_possible_moves and
+    capture_moves run with the attacks and pins already computed.
+    """
+    chess = Chess(fen)
+    legal_moves = list(chess.legal_moves)
+
+    def make_undo():
+        for move in legal_moves:
+            chess.make_move(move)
+            chess.undo_move()
+
+    results = {
+        "construct": best_time(lambda: Chess(fen), number, repeat),
+        "make_undo": best_time(make_undo, number, repeat) / max(1, len(legal_moves)),
+        "get_attacked_squares": best_time(chess.get_attacked_squares, number, repeat),
+        "get_possible_moves": best_time(chess.get_possible_moves, number, repeat),
+        "capture_moves": best_time(chess.capture_moves, number, repeat),
+        "perft": best_time(lambda: count_nodes(chess, perft_depth), 1, repeat),
+    }
+    return {phase: round(seconds * 1e6, 3) for phase, seconds in results.items()}
+
+
+def run(number: int = 200, repeat: int = 3, perft_depth: int = 3) -> dict:
+    results = {
+        "python": platform.python_version(),
+        "perft_depth": perft_depth,
+        "unit": "microseconds",
+        "positions": {},
+    }
+    for name, fen in benchmark_positions().items():
+        results["positions"][name] = benchmark_position(fen, number, repeat, perft_depth)
+        print(f"{name: <12}", "  ".join(f"{phase} {value:.1f}" for phase, value in results["positions"][name].items()))
+    return results
+
+
+def compare(results: dict, previous: dict, threshold: float = 1.1) -> dict[str, float]:
+    """
+    Print the ratio new / previous time of every phase and position, those above `threshold`
+    are marked slower. Returns the geometric mean ratio of each phase over the shared positions.
+    """
+    print()
+    print(f"{'': <12}", "  ".join(f"{phase: >20}" for phase in PHASES))
+    products = {phase: 1.0 for phase in PHASES}
+    counts = {phase: 0 for phase in PHASES}
+    for name, phases in results["positions"].items():
+        old = previous["positions"].get(name)
+        if old is None:
+            continue
+        cells = []
+        for phase in PHASES:
+            if not old.get(phase) or phase not in phases:
+                cells.append(f"{'-': >20}")
+                continue
+            ratio = phases[phase] / old[phase]
+            products[phase] *= ratio
+            counts[phase] += 1
+            cells.append(f"{ratio: >12.2f}{' slower' if ratio > threshold else '': >8}")
+        print(f"{name: <12}", "  ".join(cells))
+
+    means = {phase: products[phase] ** (1 / counts[phase]) for phase in PHASES if counts[phase]}
+    print(f"{'mean': <12}", "  ".join(f"{means.get(phase, 0): >12.2f}{' slower' if means.get(phase, 0) > threshold else '': >8}"
+                                      for phase in PHASES))
+    return means
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the phases of move generation on a fixed set of positions.")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("-n", "--number", type=int, default=200, help="calls per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timing runs, the best one is kept")
+    parser.add_argument("--perft-depth", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="ratio of new to previous time above which a phase is reported slower")
+    args = parser.parse_args()
+
+    results = run(args.number, args.repeat, args.perft_depth)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+            file.write("\n")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file), args.threshold)
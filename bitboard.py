@@ -0,0 +1,113 @@
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = (1 << 64) - 1
+
+
+def square_index(position: tuple[int, int]) -> int:
+    """
+    Convert a (row, col) position to a square index, e.g. (0, 0) -> 0 (a8), (7, 7) -> 63 (h1).
+    """
+    return position[0] * 8 + position[1]
+
+
+def square_position(square: int) -> tuple[int, int]:
+    """
+    Convert a square index to a (row, col) position, e.g. 63 -> (7, 7).
+    """
+    return (square >> 3, square & 7)
+
+
+def iter_squares(bitboard: int):
+    """
+    Yield the square index of every set bit, lowest first.
+    """
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+
+class Board:
+    """
+    Bitboard representation of the piece placement.
+
+    Every piece type/color pair has its own 64-bit integer (index: side * 6 + kind)
+    and the occupancy of each side is kept alongside. Bit n is set when square n is
+    occupied, squares are numbered row * 8 + col so a8 is 0 and h1 is 63.
+    `squares` mirrors the bitboards as a mailbox to answer "what is on this square".
+    """
+
+    def __init__(self):
+        self.bitboards: list[int] = [0] * 12
+        self.occupancy: list[int] = [0, 0]
+        self.occupied: int = 0
+        self.squares: list = [None] * 64
+
+    def clear(self) -> None:
+        """
+        Empty the board in place.
+        """
+        for index in range(12):
+            self.bitboards[index] = 0
+        self.occupancy[0] = self.occupancy[1] = 0
+        self.occupied = 0
+        self.squares[:] = [None] * 64
+
+    def __getitem__(self, row: int) -> list:
+        # keeps board[row][col] lookups working for the ui and printing
+        return self.squares[row * 8:row * 8 + 8]
+
+    def __iter__(self):
+        # the rows, __getitem__ alone never runs out of them
+        for row in range(8):
+            yield self.squares[row * 8:row * 8 + 8]
+
+    def put(self, piece, square: int) -> None:
+        bit = 1 << square
+        self.bitboards[piece.index] |= bit
+        self.occupancy[piece.side] |= bit
+        self.occupied |= bit
+        self.squares[square] = piece
+
+    def remove(self, square: int):
+        piece = self.squares[square]
+        if piece:
+            mask = ~(1 << square)
+            self.bitboards[piece.index] &= mask
+            self.occupancy[piece.side] &= mask
+            self.occupied &= mask
+            self.squares[square] = None
+        return piece
+
+    def move(self, start: int, end: int) -> None:
+        """
+        Move the piece on `start` to the empty square `end`.
+        """
+        piece = self.squares[start]
+        flip = (1 << start) | (1 << end)
+        self.bitboards[piece.index] ^= flip
+        self.occupancy[piece.side] ^= flip
+        self.occupied ^= flip
+        self.squares[start] = None
+        self.squares[end] = piece
+
+    def copy(self) -> "Board":
+        """
+        Copy of the board with copies of its pieces.
+        """
+        board = Board.__new__(Board)
+        board.bitboards = self.bitboards.copy()
+        board.occupancy = self.occupancy.copy()
+        board.occupied = self.occupied
+        board.squares = [piece.copy() if piece else None for piece in self.squares]
+        return board
+
+    def pieces(self, side: int):
+        """
+        Yield every piece of the given side.
+        """
+        squares = self.squares
+        for square in iter_squares(self.occupancy[side]):
+            yield squares[square]
+
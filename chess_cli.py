@@ -1,57 +1,364 @@
-from utils import notation_to_position, position_to_notation, FILES, RANKS
-from pieces import Piece, Pawn, Rook, Knight, Bishop, Queen, King
+from typing import Iterator, NamedTuple
+
+from utils import notation_to_position, position_to_notation, FILES, RANKS, SQUARE_NAMES, SQUARES, BETWEEN, \
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, LINES, ROOK_LINES, BISHOP_LINES
+from bitboard import Board, FULL, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, iter_squares
+from moves import CAPTURE, DOUBLE_PUSH, EN_PASSANT, CASTLING, SQUARE_MASK, MOVE_MASK, CASTLING_RIGHTS, move_start, \
+    move_promotion, move_to_string, string_to_key, castling_rook_squares, en_passant_victim
+from pieces import Piece, Pawn, Rook, Knight, Bishop, Queen, King, ALL_MOVES, CAPTURES, QUIET_MOVES, \
+    rook_attacks, bishop_attacks
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, ep_key, compute_hash
+from profiler import PhaseProfiler
+from evaluation import MG_TABLES, EG_TABLES, PHASE_WEIGHTS, compute_terms, taper
+
+PROMOTION_CLASSES = {KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+class UndoRecord(NamedTuple):
+    """
+    Everything apply_move cannot recompute when a move is taken back, one record per ply.
+    The castled rook is found again from the move, see castling_rook_squares.
+    """
+    move: int
+    piece: Piece  # the moved piece, the pawn on a promotion
+    captured: Piece | None  # also the pawn taken en passant
+    castling: int
+    ep_square: int | None
+    half_move_clock: int
+    hash: int
+    mg_score: int
+    eg_score: int
+    phase: int
+
+
+class Snapshot(NamedTuple):
+    """
+    Position state saved by Chess.snapshot. The pieces are kept as they are and put back on
+    their squares by restore, so a snapshot is only valid for the instance that took it.
+    """
+    squares: tuple[Piece | None, ...]
+    bitboards: tuple[int, ...]
+    kings: tuple[Piece, Piece]
+    turn: int
+    castling: int
+    ep_square: int | None
+    half_move_clock: int
+    full_move_clock: int
+    hash: int
+    mg_score: int
+    eg_score: int
+    phase: int
+    history: tuple[UndoRecord, ...]
 
 
 class Chess:
-    def __init__(self, fen: str = None):
+    def __init__(self, fen: str = None, incremental: bool = True, profile: bool = False, pseudo_legal: bool = False):
         self.colors = ["w", "b"]
-
-        fen_string = fen if fen else "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-        pieces, turn, castling, enpassant, half_move_clock, full_move_clock = fen_string.split()
-        self.game_over = False
-        self.board: list[list[Piece]] = self.parse_pieces(pieces)
-        self.turn = self.colors.index(turn)
-        self.castling: list[bool] = self.parse_castling(castling)
-        self.enpassant = enpassant
-        self.half_move_clock = int(half_move_clock)
-        self.full_move_clock = int(full_move_clock)
-        self.checking_pieces: list[Piece] = []
-        self.attacked_squares: dict[str, list[tuple[int, int]]]
-        self.legal_moves: list[str] = []
-        self.moved_pieces: list[list[Piece]] = []
-
-        self.previous_castlings: list[list[bool]] = []
-        self.previous_enpassants: list[str] = []
-
+        # update only the attacks a move can change instead of recomputing every piece
+        self.incremental = incremental
+        # generate pseudo-legal moves and test each one for king safety, instead of filtering
+        # the moves with the attacked squares, check mask and pins
+        self.pseudo_legal = pseudo_legal
+
+        self.board: Board = Board()
+        self.turn: int = 0
+        # bit i is castling right i: K, Q, k, q
+        self.castling: int = 0
+        self.ep_square: int | None = None
+        self.half_move_clock: int = 0
+        self.full_move_clock: int = 1
+        self.history: list[UndoRecord] = []
         self.kings: tuple[Piece, Piece] = (None, None)
+        # updated with every move, see apply_move and check_special_cases
+        self._hash: int = 0
+        # evaluation terms, updated with every move as well, see evaluation.py
+        self.mg_score: int = 0
+        self.eg_score: int = 0
+        self.phase: int = 0
+
+        # Everything derived from the position is computed on first access and
+        # cached until the next make_move/undo_move, see invalidate.
+        self._attacked_squares: int | None = None
+        self._checking_pieces: list[Piece] | None = None
+        # squares that resolve the current check, see check_check
+        self._check_mask: int = FULL
+        self._pins: dict[int, int] | None = None
+        self._moves: list[int] | None = None
+        self._pseudo_legal_moves: list[int] | None = None
+        self._in_check: bool | None = None
+        # squares the king may not step or castle to, see get_king_danger
+        self._king_danger: int | None = None
+        self._legal_moves: list[str] | None = None
+        self._game_over: bool | None = None
+        # squares changed since the piece attack sets were last updated
+        self.pending_changes: int = FULL
+
+        # per-phase counters, see enable_profiling
+        self.profiler: PhaseProfiler | None = None
+        if profile:
+            self.enable_profiling()
+
+        self.set_fen(fen if fen else START_FEN)
+
+    def set_fen(self, fen: str) -> None:
+        """
+        Load a position into this instance. The board is emptied and refilled in place and,
+        as after any move, nothing is generated until it is asked for.
+        The clocks are optional (0 1), the first four fields of an EPD line are enough.
+        """
+        fields = fen.split()
+        pieces, turn, castling, enpassant = fields[:4]
+        self.board.clear()
+        self.parse_pieces(pieces, self.board)
+        self.turn = self.colors.index(turn)
+        self.castling = self.parse_castling(castling)
+        self.ep_square = SQUARES.get(enpassant)
+        self.half_move_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.full_move_clock = int(fields[5]) if len(fields) > 5 else 1
+        self.history = []
         self.get_kings()
+        self._hash = self.compute_zobrist_hash()
+        self.mg_score, self.eg_score, self.phase = compute_terms(self.board)
+        self.invalidate(FULL)
+
+    def to_fen(self) -> str:
+        rows = []
+        for row in self.board:
+            text, empty = "", 0
+            for piece in row:
+                if piece:
+                    if empty:
+                        text += str(empty)
+                        empty = 0
+                    text += piece.symbol()
+                else:
+                    empty += 1
+            rows.append(text + str(empty) if empty else text)
+        return f"{'/'.join(rows)} {self.colors[self.turn]} {self.castling_rights} {self.enpassant} " \
+               f"{self.half_move_clock} {self.full_move_clock}"
+
+    def enable_profiling(self) -> PhaseProfiler:
+        """
+        Start counting calls, time and generated moves per phase, see profiler.py.
+        The counters are kept when profiling is disabled and enabled again.
+        """
+        if self.profiler is None:
+            self.profiler = PhaseProfiler(self)
+        self.profiler.enable()
+        return self.profiler
+
+    def disable_profiling(self) -> None:
+        if self.profiler:
+            self.profiler.disable()
+
+    def profile_report(self) -> str:
+        return self.profiler.report() if self.profiler else "Profiling is not enabled."
+
+    def reset_profile(self) -> None:
+        if self.profiler:
+            self.profiler.reset()
+
+    def clone(self) -> "Chess":
+        """
+        Independent copy of the position, without re-parsing a FEN or recomputing the moves:
+        the pieces are copied and the cached attacks, pins and moves are carried over.
+        The copy starts with an empty history, its moves cannot be taken back past the clone.
+        """
+        chess = Chess.__new__(Chess)
+        chess.colors = self.colors
+        chess.incremental = self.incremental
+        chess.pseudo_legal = self.pseudo_legal
+        chess.board = self.board.copy()
+        squares = chess.board.squares
+        chess.turn = self.turn
+        chess.castling = self.castling
+        chess.ep_square = self.ep_square
+        chess.half_move_clock = self.half_move_clock
+        chess.full_move_clock = self.full_move_clock
+        chess.history = []
+        chess.kings = tuple(squares[king.square] for king in self.kings)
+        chess._hash = self._hash
+        chess.mg_score, chess.eg_score, chess.phase = self.mg_score, self.eg_score, self.phase
+
+        chess._attacked_squares = self._attacked_squares
+        chess._checking_pieces = None if self._checking_pieces is None else \
+            [squares[piece.square] for piece in self._checking_pieces]
+        chess._check_mask = self._check_mask
+        # these are rebuilt, never changed in place, so they can be shared
+        chess._pins = self._pins
+        chess._moves = self._moves
+        chess._pseudo_legal_moves = self._pseudo_legal_moves
+        chess._in_check = self._in_check
+        chess._king_danger = self._king_danger
+        chess._legal_moves = self._legal_moves
+        chess._game_over = self._game_over
+        chess.pending_changes = self.pending_changes
+        chess.profiler = None
+        return chess
+
+    def snapshot(self) -> Snapshot:
+        """
+        Save the position and its history, restore() brings them back after any moves or undos.
+        """
+        return Snapshot(tuple(self.board.squares), tuple(self.board.bitboards), self.kings, self.turn,
+                        self.castling, self.ep_square, self.half_move_clock, self.full_move_clock, self._hash,
+                        self.mg_score, self.eg_score, self.phase, tuple(self.history))
+
+    def restore(self, snapshot: Snapshot) -> None:
+        board = self.board
+        board.squares = list(snapshot.squares)
+        for square, piece in enumerate(board.squares):
+            if piece and piece.square != square:
+                piece.move((square >> 3, square & 7))
+        # undo_move puts a captured piece back on its own square, which it may have left
+        # if the game was taken back past the snapshot and replayed since
+        for record in snapshot.history:
+            captured = record.captured
+            if captured:
+                move = record.move
+                square = en_passant_victim(move) if move & EN_PASSANT else (move >> 6) & SQUARE_MASK
+                if captured.square != square:
+                    captured.move((square >> 3, square & 7))
+        board.bitboards = list(snapshot.bitboards)
+        board.occupancy = [0, 0]
+        for index, bitboard in enumerate(board.bitboards):
+            board.occupancy[index >= 6] |= bitboard
+        board.occupied = board.occupancy[0] | board.occupancy[1]
+
+        self.kings = snapshot.kings
+        self.turn = snapshot.turn
+        self.castling = snapshot.castling
+        self.ep_square = snapshot.ep_square
+        self.half_move_clock = snapshot.half_move_clock
+        self.full_move_clock = snapshot.full_move_clock
+        self._hash = snapshot.hash
+        self.mg_score, self.eg_score, self.phase = snapshot.mg_score, snapshot.eg_score, snapshot.phase
+        self.history = list(snapshot.history)
+        self.invalidate(FULL)
+
+    def evaluate(self) -> int:
+        """
+        Tapered piece-square evaluation in centipawns for the side to move, see evaluation.py.
+        """
+        return taper(self.mg_score, self.eg_score, self.phase, self.turn)
+
+    @property
+    def zobrist_hash(self) -> int:
+        """
+        64-bit Zobrist hash of the position: pieces, side to move, castling rights and en passant file.
+        """
+        return self._hash
 
-        self.get_attacked_squares()
-        self.check_check()
-        self.get_possible_moves()
-        self.is_game_over()
+    def compute_zobrist_hash(self) -> int:
+        """
+        Compute the Zobrist hash from scratch, it always equals `zobrist_hash`.
+        """
+        return compute_hash(self.board, self.turn, self.castling, self.ep_square)
+
+    @property
+    def attacked_squares(self) -> int:
+        if self._attacked_squares is None:
+            self.update_attacked_squares(self.pending_changes)
+        return self._attacked_squares
+
+    @property
+    def checking_pieces(self) -> list[Piece]:
+        if self._checking_pieces is None:
+            self.check_check()
+        return self._checking_pieces
+
+    @property
+    def check_mask(self) -> int:
+        if self._checking_pieces is None:
+            self.check_check()
+        return self._check_mask
+
+    @property
+    def king_danger(self) -> int:
+        if self._king_danger is None:
+            self.get_king_danger()
+        return self._king_danger
+
+    @property
+    def pins(self) -> dict[int, int]:
+        if self._pins is None:
+            self.get_pins()
+        return self._pins
+
+    @property
+    def moves(self) -> list[int]:
+        """
+        Legal moves of the side to move, encoded as in moves.py.
+        """
+        if self._moves is None:
+            self.get_possible_moves()
+        return self._moves
+
+    @property
+    def pseudo_legal_moves(self) -> list[int]:
+        """
+        Moves of the side to move that may leave its own king in check, see is_legal.
+        """
+        if self._pseudo_legal_moves is None:
+            self.get_pseudo_legal_moves()
+        return self._pseudo_legal_moves
+
+    @property
+    def legal_moves(self) -> list[str]:
+        if self._legal_moves is None:
+            self._legal_moves = [move_to_string(move) for move in self.moves]
+        return self._legal_moves
+
+    @property
+    def castling_rights(self) -> str:
+        return "".join(right for i, right in enumerate("KQkq") if self.castling >> i & 1) or "-"
+
+    @property
+    def enpassant(self) -> str:
+        return "-" if self.ep_square is None else SQUARE_NAMES[self.ep_square]
+
+    @property
+    def game_over(self) -> bool:
+        if self._game_over is None:
+            self.is_game_over()
+        return self._game_over
+
+    def invalidate(self, changed: int) -> None:
+        """
+        Drop the cached attacks, checks and moves after the `changed` squares were updated.
+        """
+        self.pending_changes |= changed if self.incremental else FULL
+        self._attacked_squares = None
+        self._checking_pieces = None
+        self._pins = None
+        self._moves = None
+        self._pseudo_legal_moves = None
+        self._in_check = None
+        self._king_danger = None
+        self._legal_moves = None
+        self._game_over = None
 
     def is_game_over(self):
-        pieces_on_board = []
-        for r in self.board:
-            for c in r:
-                if c:
-                    pieces_on_board.append(c)
-        if len(pieces_on_board) == 2:
-            self.game_over = True  # stalemate
+        self._game_over = False
+        if self.board.occupied.bit_count() == 2:
+            self._game_over = True  # stalemate
             # print("Stalemate! The game is a draw.")
-        if len(self.legal_moves) == 0:
-            self.game_over = True  # stalemate or checkmate
+        # one legal move is enough to go on, the full list is not needed
+        if next(self.generate_moves(), None) is None:
+            self._game_over = True  # stalemate or checkmate
             if len(self.checking_pieces) > 0:
                 # print(f"Checkmate! {self.colors[1 - self.turn]} wins!")
                 pass
             else:
-                self.legal_moves = []
                 # print("Stalemate! The game is a draw.")
+                pass
 
-    def parse_pieces(self, fen_piece_part: str) -> list[list[Piece | None]]:
+    def parse_pieces(self, fen_piece_part: str, board: Board = None) -> Board:
         rows = fen_piece_part.split('/')
-        board = [[None for _ in range(8)] for _ in range(8)]
+        if len(rows) != 8:
+            raise ValueError(f"{fen_piece_part}: expected 8 ranks, got {len(rows)}")
+        board = Board() if board is None else board
 
         for r, row in enumerate(rows):
             c = 0
@@ -59,11 +366,15 @@ class Chess:
                 if char.isdigit():
                     c += int(char)
                 else:
+                    if c >= 8 or char.lower() not in "prnbqk":
+                        raise ValueError(f"{fen_piece_part}: invalid rank {row}")
                     color = 'w' if char.isupper() else 'b'
                     piece_type = char.lower()
                     piece = self.create_piece(piece_type, color, (r, c))
-                    board[r][c] = piece
+                    board.put(piece, r * 8 + c)
                     c += 1
+            if c != 8:
+                raise ValueError(f"{fen_piece_part}: invalid rank {row}")
         return board
 
     def create_piece(self, piece_type: str, color: str, position: tuple) -> Piece:
@@ -79,24 +390,21 @@ class Chess:
 
     def get_kings(self):
         wk, bk = None, None
-        for row in self.board:
-            for piece in row:
-                if wk != None and bk != None:
-                    self.kings = (wk, bk)
-                    return
-                if piece:
-                    if piece.symbol() == "K":
-                        wk = piece
-                    elif piece.symbol() == "k":
-                        bk = piece
-
-    def parse_castling(self, castling: str) -> list[bool]:
-        return [
-            "K" in castling,
-            "Q" in castling,
-            "k" in castling,
-            "q" in castling
-        ]
+        for piece in self.board.squares:
+            if piece:
+                if piece.symbol() == "K":
+                    wk = piece
+                elif piece.symbol() == "k":
+                    bk = piece
+        self.kings = (wk, bk)
+
+    def parse_castling(self, castling: str) -> int:
+        return (
+            ("K" in castling) |
+            ("Q" in castling) << 1 |
+            ("k" in castling) << 2 |
+            ("q" in castling) << 3
+        )
 
     def print_board(self):
         for r in self.board:
@@ -107,212 +415,404 @@ class Chess:
 
     def print_game_info(self):
         print("Turn:", self.turn, self.colors[self.turn])
-        print("Castling:", self.castling)
+        print("Castling:", self.castling_rights)
         print("En Passant:", self.enpassant)
         print("Half Move:", self.half_move_clock)
         print("Full Move:", self.full_move_clock)
 
-    def make_move(self, move: str):
+    def make_move(self, move: str) -> bool:
         """
         Make a move on the board using algebraic notation, e.g., 'e2e4'.
         """
-        # moved pieces
-        mp = []
+        encoded = self.parse_move(move)
+        if encoded is None:
+            return False
+        self.apply_move(encoded)
+        return True
 
+    def parse_move(self, move: str) -> int | None:
+        """
+        Find the legal encoded move for a string like 'e2e4' or 'e7e8q', None if there is none.
+        """
         # check if move is valid
-        if (move[0] not in FILES) or \
-            (move[1] not in RANKS) or \
-            (move[2] not in FILES) or \
-                (move[3] not in RANKS):
+        key = string_to_key(move)
+        if key is None:
             print(f"{move} is not a valid string. Valid string example: 'e2e4'.")
-            return False
-
-        # Parse the move
-        (start_row, start_col) = notation_to_position(move[:2])
-        (end_row, end_col) = notation_to_position(move[2:])
-        promotion = "-"
-        if len(move) == 5:
-            promotion = move[4]
+            return None
 
         # Get the piece that will be moved
-        piece = self.board[start_row][start_col]
-        target_piece = self.board[end_row][end_col]
+        piece = self.board.squares[move_start(key)]
         if not piece:
             # print(f"No piece at {move[:2]} to move.")
-            return False
-        if piece.color != self.colors[self.turn]:
+            return None
+        if piece.side != self.turn:
             # print(f"It is {self.colors[self.turn]}'s turn.")
-            return False
-        if (end_row, end_col, promotion) not in piece.possible_moves:
-            # print("Move is not valid!")
-            return False
-
-        self.previous_castlings.append(self.castling.copy())
-        self.previous_enpassants.append(self.enpassant)
-
-        mp.append(piece)
-        mp.append(target_piece)
+            return None
+        if self.pseudo_legal:
+            # the piece's pseudo-legal moves, only the matching one is tested for king safety
+            piece.calculate_possible_moves(self.board, 0, FULL, {}, self.kings[self.turn].square,
+                                           self.castling, self.ep_square)
+            candidates = piece.possible_moves
+        elif self._moves is None:
+            # nobody asked for the legal moves yet, only generate the moving piece's
+            piece.calculate_possible_moves(self.board, self.king_danger, self.check_mask, self.pins,
+                                           self.kings[self.turn].square, self.castling, self.ep_square)
+            candidates = piece.possible_moves
+        else:
+            # capture_moves, quiet_moves or pseudo_legal_moves may have overwritten the pieces' lists
+            # since, the cached list is complete
+            candidates = self._moves
+        for encoded in candidates:
+            if encoded & MOVE_MASK == key:
+                return encoded if not self.pseudo_legal or self.is_legal(encoded) else None
+        # print("Move is not valid!")
+        return None
+
+    def apply_move(self, move: int) -> None:
+        """
+        Make an encoded move taken from `moves`, it is not validated.
+        """
+        start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+        piece = self.board.squares[start]
+        target_piece = self.board.squares[end]
+        castling, ep_square, zobrist_hash = self.castling, self.ep_square, self._hash
+        mg_score, eg_score, phase = self.mg_score, self.eg_score, self.phase
 
         # update the board
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = None
-
-        self.check_special_cases(
-            piece, target_piece, start_row, start_col, end_row, end_col, mp, promotion)
-        self.moved_pieces.append(mp)
+        index = piece.index
+        keys = PIECE_KEYS[index]
+        self._hash ^= CASTLING_KEYS[castling] ^ ep_key(ep_square) ^ \
+            keys[start] ^ keys[end] ^ SIDE_KEY
+        self.mg_score += MG_TABLES[index][end] - MG_TABLES[index][start]
+        self.eg_score += EG_TABLES[index][end] - EG_TABLES[index][start]
+        if target_piece:
+            index = target_piece.index
+            self._hash ^= PIECE_KEYS[index][end]
+            self.mg_score -= MG_TABLES[index][end]
+            self.eg_score -= EG_TABLES[index][end]
+            self.phase -= PHASE_WEIGHTS[target_piece.kind]
+            self.board.remove(end)
+        self.board.move(start, end)
+
+        captured = self.check_special_cases(piece, target_piece, move)
+        self._hash ^= CASTLING_KEYS[self.castling] ^ ep_key(self.ep_square)
+        self.history.append(UndoRecord(move, piece, captured, castling, ep_square, self.half_move_clock,
+                                       zobrist_hash, mg_score, eg_score, phase))
 
         # move the piece
-        piece.move((end_row, end_col))
+        piece.move((end >> 3, end & 7))
 
         # Update turn and move counters
         self.turn = 1 - self.turn
         self.full_move_clock += 1 if self.turn == 0 else 0
-        self.half_move_clock = 0 if isinstance(
+        self.half_move_clock = 0 if captured or isinstance(
             piece, Pawn) else self.half_move_clock + 1
         # self.print_board()
-        self.get_attacked_squares()
-        self.check_check()
-        self.get_possible_moves()
-        self.is_game_over()
-        return True
+        self.invalidate(self.changed_squares(move))
 
-    def check_special_cases(self, piece: Piece, target_piece: Piece, start_row: int, start_col: int, end_row: int, end_col: int, mp: list[Piece], promotion: str):
-        if isinstance(piece, Pawn) and end_row in [0, 7]:
-            promotion_classes = {
-                'r': Rook,
-                'n': Knight,
-                'b': Bishop,
-                'q': Queen,
-            }
-            # check if pawn reached the end of the board
-            promoted_piece = promotion_classes[promotion](
-                piece.color, (end_row, end_col))
-            self.board[end_row][end_col] = promoted_piece
-            self.enpassant = "-"
-        elif isinstance(piece, Pawn) and abs(end_row-start_row) == 2:
-            # check if pawn moved 2 sq and update enpassant
-            self.enpassant = position_to_notation(
-                (end_row+1, end_col)) if piece.color == "w" else position_to_notation((end_row-1, end_col))
-        elif isinstance(piece, Pawn) and position_to_notation((end_row, end_col)) == self.enpassant:
-            # check for enpassant capturing
-            if piece.color == "w":
-                pawn = self.board[end_row+1][end_col]
-                self.board[end_row+1][end_col] = None
-                mp[1] = pawn
-            else:
-                pawn = self.board[end_row-1][end_col]
-                self.board[end_row-1][end_col] = None
-                mp[1] = pawn
-            self.enpassant = "-"
-        elif isinstance(piece, King) and abs(end_col-start_col) == 2:
-            # check for castling
-            if end_col-start_col == 2:
-                rook = self.board[end_row][-1]
-                self.board[end_row][end_col-1] = rook
-                self.board[end_row][-1] = None
-                rook.move((end_row, end_col-1))
-                mp.append(rook)
-            else:
-                rook = self.board[end_row][0]
-                self.board[end_row][end_col+1] = rook
-                self.board[end_row][0] = None
-                rook.move((end_row, end_col+1))
-                mp.append(rook)
-            if piece.color == "w":
-                self.castling[0] = False
-                self.castling[1] = False
-            else:
-                self.castling[2] = False
-                self.castling[3] = False
-            self.enpassant = "-"
-        elif isinstance(piece, King):
-            if piece.color == "w":
-                self.castling[0] = False
-                self.castling[1] = False
-            else:
-                self.castling[2] = False
-                self.castling[3] = False
-            self.enpassant = "-"
-        elif isinstance(piece, Rook):
-            match (piece.color, piece.position[1]):
-                case ("w", 7):
-                    self.castling[0] = False
-                case ("w", 0):
-                    self.castling[1] = False
-                case ("b", 7):
-                    self.castling[2] = False
-                case ("b", 0):
-                    self.castling[3] = False
-            self.enpassant = "-"
-        elif isinstance(target_piece, Rook):
-            match (target_piece.color, target_piece.position[1]):
-                case ("w", 7):
-                    self.castling[0] = False
-                case ("w", 0):
-                    self.castling[1] = False
-                case ("b", 7):
-                    self.castling[2] = False
-                case ("b", 0):
-                    self.castling[3] = False
-            self.enpassant = "-"
-        else:
-            self.enpassant = "-"
+    def check_special_cases(self, piece: Piece, target_piece: Piece, move: int) -> Piece | None:
+        """
+        Promotion, en passant, castling and the castling rights. Returns the captured piece.
+        """
+        start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+        self.ep_square = None
+        captured = target_piece
+        if move_promotion(move):
+            # pawn reached the end of the board
+            promoted_piece = PROMOTION_CLASSES[move_promotion(move)](
+                piece.color, (end >> 3, end & 7))
+            self._hash ^= PIECE_KEYS[piece.index][end] ^ PIECE_KEYS[promoted_piece.index][end]
+            self.mg_score += MG_TABLES[promoted_piece.index][end] - MG_TABLES[piece.index][end]
+            self.eg_score += EG_TABLES[promoted_piece.index][end] - EG_TABLES[piece.index][end]
+            self.phase += PHASE_WEIGHTS[promoted_piece.kind]
+            self.board.remove(end)
+            self.board.put(promoted_piece, end)
+        elif move & DOUBLE_PUSH:
+            # the square the pawn skipped can be captured en passant
+            self.ep_square = (start + end) // 2
+        elif move & EN_PASSANT:
+            victim = en_passant_victim(move)
+            captured = self.board.remove(victim)
+            self._hash ^= PIECE_KEYS[captured.index][victim]
+            self.mg_score -= MG_TABLES[captured.index][victim]
+            self.eg_score -= EG_TABLES[captured.index][victim]
+        elif move & CASTLING:
+            rook_start, rook_end = castling_rook_squares(move)
+            rook = self.board.squares[rook_start]
+            self._hash ^= PIECE_KEYS[rook.index][rook_start] ^ PIECE_KEYS[rook.index][rook_end]
+            self.mg_score += MG_TABLES[rook.index][rook_end] - MG_TABLES[rook.index][rook_start]
+            self.eg_score += EG_TABLES[rook.index][rook_end] - EG_TABLES[rook.index][rook_start]
+            self.board.move(rook_start, rook_end)
+            rook.move((rook_end >> 3, rook_end & 7))
+
+        # moving the king or a rook, or capturing a rook on its corner, removes castling rights
+        self.castling &= CASTLING_RIGHTS[start] & CASTLING_RIGHTS[end]
+        return captured
 
     def undo_move(self):
-        if len(self.moved_pieces) == 0:
+        if len(self.history) == 0:
             return
-        last_moved_pieces = self.moved_pieces.pop()
+        move, piece, captured, castling, ep_square, half_move_clock, zobrist_hash, \
+            self.mg_score, self.eg_score, self.phase = self.history.pop()
+        start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+
+        # removes the promoted piece as well if the pawn was promoted
+        self.board.remove(end)
+        piece.move((start >> 3, start & 7))
+        self.board.put(piece, start)
+
+        if captured:
+            self.board.put(captured, captured.square)
+
+        if move & CASTLING:
+            rook_start, rook_end = castling_rook_squares(move)
+            rook = self.board.squares[rook_end]
+            self.board.move(rook_end, rook_start)
+            rook.move((rook_start >> 3, rook_start & 7))
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self._hash = zobrist_hash
+        self.half_move_clock = half_move_clock
+        self.turn = 1 - self.turn
+        # the full move number went up after black's move
+        self.full_move_clock -= 1 if self.turn == 1 else 0
+        self.invalidate(self.changed_squares(move))
 
-        p = last_moved_pieces[0]
-        self.board[p.position[0]][p.position[1]] = None
-        p.undo_move()
-        self.board[p.position[0]][p.position[1]] = p
+    def check_check(self):
+        king_square = self.kings[self.turn].square
+        checkers = self.attackers_to(king_square, 1 - self.turn)
+        self._checking_pieces = [self.board.squares[square] for square in iter_squares(checkers)]
+
+        if len(self._checking_pieces) == 0:
+            self._check_mask = FULL
+        elif len(self._checking_pieces) == 1:
+            # capture the checking piece or block the line between it and the king
+            checker = self._checking_pieces[0].square
+            self._check_mask = (1 << checker) | BETWEEN[king_square][checker]
+        else:
+            # double check, only the king can move
+            self._check_mask = 0
 
-        if last_moved_pieces[1]:
-            p = last_moved_pieces[1]
-            self.board[p.position[0]][p.position[1]] = p
+    def get_pins(self) -> None:
+        """
+        Find the pieces of the side to move that are pinned to their king. Only the enemy
+        sliders on a line with the king are looked at, a piece is pinned when it is the only
+        piece between one of them and the king. It may then only move along that line.
+        """
+        board = self.board
+        king_square = self.kings[self.turn].square
+        king_row, king_col = king_square >> 3, king_square & 7
+        enemy = (1 - self.turn) * 6
+        queens = board.bitboards[enemy + QUEEN]
+        rooks = board.bitboards[enemy + ROOK] | queens
+        bishops = board.bitboards[enemy + BISHOP] | queens
+        own = board.occupancy[self.turn]
+
+        self._pins = {}
+        for square in iter_squares(rooks | bishops):
+            row, col = square >> 3, square & 7
+            if row == king_row or col == king_col:
+                if not rooks >> square & 1:
+                    continue
+            elif abs(row - king_row) == abs(col - king_col):
+                if not bishops >> square & 1:
+                    continue
+            else:
+                continue
+            between = BETWEEN[king_square][square]
+            blockers = between & board.occupied
+            if blockers & own and blockers & (blockers - 1) == 0:
+                self._pins[blockers.bit_length() - 1] = between | (1 << square)
 
-        if len(last_moved_pieces) == 3:
-            p = last_moved_pieces[2]
-            self.board[p.position[0]][p.position[1]] = None
-            p.undo_move()
-            self.board[p.position[0]][p.position[1]] = p
+    def get_possible_moves(self) -> None:
+        if self.pseudo_legal:
+            self._moves = [move for move in self.pseudo_legal_moves if self.is_legal(move)]
+            return
+        self._moves = []
+        attacked_squares, check_mask, pins = self.king_danger, self.check_mask, self.pins
+        king_square = self.kings[self.turn].square
+        for c in self.board.pieces(self.turn):
+            c.calculate_possible_moves(self.board, attacked_squares, check_mask, pins,
+                                       king_square, self.castling, self.ep_square)
+            self._moves.extend(c.possible_moves)
+
+    def generate_moves(self, captures_first: bool = False) -> Iterator[int]:
+        """
+        Yield the legal moves one piece at a time, so that a consumer that stops early
+        (any legal move left, a cutoff in search) does not pay for the rest.
+        With `captures_first` the captures and promotions of every piece come before the quiet moves,
+        which are only generated once the captures are used up.
+        Moves may be made and taken back between two yields as long as the position is restored.
+        """
+        if self._moves is not None:
+            if captures_first:
+                yield from [move for move in self._moves if move & (CAPTURE | 7 << 12)]
+                yield from [move for move in self._moves if not move & (CAPTURE | 7 << 12)]
+            else:
+                yield from self._moves
+        elif captures_first:
+            yield from self.generate_stage(CAPTURES)
+            yield from self.generate_stage(QUIET_MOVES)
+        else:
+            yield from self.generate_stage(ALL_MOVES)
 
-        self.castling = self.previous_castlings.pop()
-        self.enpassant = self.previous_enpassants.pop()
-        self.turn = 1 - self.turn
-        self.full_move_clock -= 1 if self.turn == 0 else 0
-        self.half_move_clock = 0 if self.turn == 0 else self.half_move_clock - 1
-        self.get_attacked_squares()
-        self.check_check()
-        self.get_possible_moves()
-        self.is_game_over()
+    def capture_moves(self) -> list[int]:
+        """
+        Legal captures and promotions, without generating the quiet moves.
+        """
+        return list(self.generate_stage(CAPTURES))
 
-    def check_check(self):
-        self.checking_pieces = []
-        for source, squares in self.attacked_squares.items():
-            if self.kings[self.turn].position in squares:
-                row, col = notation_to_position(source)
-                self.checking_pieces.append(self.board[row][col])
+    def quiet_moves(self) -> list[int]:
+        """
+        Legal moves that neither capture nor promote, castling included.
+        """
+        return list(self.generate_stage(QUIET_MOVES))
 
-    def get_possible_moves(self) -> None:
-        self.legal_moves = []
-        for r in self.board:
-            for c in r:
-                if c and c.color == self.colors[self.turn]:
-                    c.calculate_possible_moves(self.board, self.attacked_squares, self.checking_pieces,
-                                               self.kings[self.turn].position, self.castling, self.enpassant)
-                    self.legal_moves.extend(
-                        [f"{c.position_as_notation}{position_to_notation(m)}{m[2] if m[2] != '-' else ''}" for m in c.possible_moves])
+    def generate_stage(self, stage: int) -> Iterator[int]:
+        """
+        Yield the legal moves of a generation stage (see pieces.py) one piece at a time.
+        """
+        board, castling, ep_square = self.board, self.castling, self.ep_square
+        king_square = self.kings[self.turn].square
+        if self.pseudo_legal:
+            attacked_squares, check_mask, pins = 0, FULL, {}
+        else:
+            attacked_squares, check_mask, pins = self.king_danger, self.check_mask, self.pins
+        for piece in board.pieces(self.turn):
+            piece.calculate_possible_moves(board, attacked_squares, check_mask, pins,
+                                           king_square, castling, ep_square, stage)
+            for move in piece.possible_moves:
+                if not self.pseudo_legal or self.is_legal(move):
+                    yield move
+
+    def get_pseudo_legal_moves(self) -> None:
+        # no attacked squares, check mask or pins: the king may step into check, pinned
+        # pieces may leave their line and castling only needs the empty squares and the rook
+        self._pseudo_legal_moves = []
+        king_square = self.kings[self.turn].square
+        for c in self.board.pieces(self.turn):
+            c.calculate_possible_moves(self.board, 0, FULL, {}, king_square, self.castling, self.ep_square)
+            self._pseudo_legal_moves.extend(c.possible_moves)
+
+    def is_legal(self, move: int) -> bool:
+        """
+        Whether a pseudo-legal move of the side to move leaves its king safe. The king is
+        tested against the occupancy after the move, without making it.
+        """
+        start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+        king_square = self.kings[self.turn].square
+        enemy = 1 - self.turn
+        if move & CASTLING:
+            # the king may not castle out of, through or into check
+            middle = (start + end) // 2
+            occupied = self.board.occupied
+            return not (self.attackers_to(start, enemy, occupied) or
+                        self.attackers_to(middle, enemy, occupied) or
+                        self.attackers_to(end, enemy, occupied))
+
+        if start != king_square and not move & EN_PASSANT:
+            if self._in_check is None:
+                self._in_check = bool(self.attackers_to(king_square, enemy))
+            if not self._in_check and not LINES[king_square] >> start & 1:
+                # nothing can be uncovered by a piece that is not on a line with the king
+                return True
+
+        captured = 1 << en_passant_victim(move) if move & EN_PASSANT else 1 << end
+        occupied = (self.board.occupied & ~(1 << start) & ~captured) | (1 << end)
+        if start == king_square:
+            king_square = end
+        # the captured piece no longer attacks
+        return not self.attackers_to(king_square, enemy, occupied) & ~captured
+
+    def attackers_to(self, square: int, side: int, occupied: int = None) -> int:
+        """
+        Bitboard of the pieces of `side` that attack `square`, found by looking outwards from the
+        square with the moves of every piece type. `occupied` defaults to the board's occupancy.
+        """
+        bitboards = self.board.bitboards
+        if occupied is None:
+            occupied = self.board.occupied
+        enemy = side * 6
+        attackers = (KNIGHT_ATTACKS[square] & bitboards[enemy + KNIGHT] |
+                     PAWN_ATTACKS[1 - side][square] & bitboards[enemy + PAWN] |
+                     KING_ATTACKS[square] & bitboards[enemy + KING])
+        queens = bitboards[enemy + QUEEN]
+        rooks = (bitboards[enemy + ROOK] | queens) & ROOK_LINES[square]
+        if rooks:
+            attackers |= rook_attacks(square, occupied) & rooks
+        bishops = (bitboards[enemy + BISHOP] | queens) & BISHOP_LINES[square]
+        if bishops:
+            attackers |= bishop_attacks(square, occupied) & bishops
+        return attackers
+
+    def get_king_danger(self) -> None:
+        """
+        The attacked squares the king could step to, plus its own square and the squares it lands
+        on when castling is still possible. The king is taken off the board first, so that it
+        cannot step back along the line of a slider that checks it.
+        """
+        board = self.board
+        king_square = self.kings[self.turn].square
+        enemy = 1 - self.turn
+        occupied = board.occupied ^ (1 << king_square)
+        danger = 0
+        for target in iter_squares(KING_ATTACKS[king_square] & ~board.occupancy[self.turn]):
+            if self.attackers_to(target, enemy, occupied):
+                danger |= 1 << target
+        if self.castling >> (2 * self.turn) & 3 and king_square == (60 if self.turn == 0 else 4):
+            for target in (king_square, king_square - 2, king_square + 2):
+                if self.attackers_to(target, enemy):
+                    danger |= 1 << target
+        self._king_danger = danger
 
     def get_attacked_squares(self) -> None:
-        self.attacked_squares = {}
-        for r in self.board:
-            for c in r:
-                if c and c.color == self.colors[1-self.turn]:
-                    c.calculate_attacked_squares(self.board)
-                    if c.attacked_squares:
-                        self.attacked_squares[c.position_as_notation] = c.attacked_squares
+        self.update_attacked_squares(FULL)
+
+    def update_attacked_squares(self, changed: int) -> None:
+        """
+        Recompute only the attacks that depend on the `changed` squares: the pieces standing
+        on them and the sliders whose rays reach one of them. Every other piece keeps its attacks.
+        `changed` may collect several moves, the stored rays are those of the last update.
+        """
+        board = self.board
+        occupied = board.occupied
+        for square in iter_squares(changed & occupied):
+            board.squares[square].calculate_attacked_squares(board, occupied)
+
+        sliders = 0
+        for index in (BISHOP, ROOK, QUEEN, BISHOP + 6, ROOK + 6, QUEEN + 6):
+            sliders |= board.bitboards[index]
+        for square in iter_squares(sliders & ~changed):
+            c = board.squares[square]
+            if c.attacked_squares & changed:
+                c.calculate_attacked_squares(board, occupied)
+        self.pending_changes = 0
+        self.collect_attacked_squares()
+
+    def changed_squares(self, move: int) -> int:
+        """
+        Squares whose occupancy changes with an encoded move.
+        """
+        changed = (1 << (move & SQUARE_MASK)) | (1 << ((move >> 6) & SQUARE_MASK))
+        if move & EN_PASSANT:
+            changed |= 1 << en_passant_victim(move)
+        elif move & CASTLING:
+            rook_start, rook_end = castling_rook_squares(move)
+            changed |= (1 << rook_start) | (1 << rook_end)
+        return changed
+
+    def collect_attacked_squares(self) -> None:
+        king_square = self.kings[self.turn].square
+        occupied = self.board.occupied & ~(1 << king_square)
+        attacked_squares = 0
+        for c in self.board.pieces(1 - self.turn):
+            if c.attacked_squares >> king_square & 1 and c.kind in (BISHOP, ROOK, QUEEN):
+                # a checking slider also attacks the squares behind the king
+                attacked_squares |= c.get_attacks(occupied)
+            else:
+                attacked_squares |= c.attacked_squares
+        self._attacked_squares = attacked_squares
 
 
 if __name__ == "__main__":
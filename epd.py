@@ -0,0 +1,49 @@
+from typing import Iterator
+
+from chess_cli import Chess
+
+
+def split_epd(line: str) -> tuple[str, dict[str, str]]:
+    """
+    Split a FEN or EPD line into a six field FEN and the EPD operations, e.g.
+    'r1bqkbnr/... w KQkq - bm Nf3; id "pos 1";' -> ('r1bqkbnr/... w KQkq - 0 1', {'bm': 'Nf3', 'id': '"pos 1"'}).
+    EPD has no clocks, they are taken from the hmvc and fmvn operations when present.
+    """
+    fields = line.split(maxsplit=4)
+    rest = fields[4] if len(fields) > 4 else ""
+    clocks = rest.split(maxsplit=2)
+    if len(clocks) >= 2 and clocks[0].isdigit() and clocks[1].isdigit():
+        # a FEN line, anything after the clocks is ignored
+        return " ".join(fields[:4] + clocks[:2]), {}
+
+    operations = {}
+    for operation in rest.split(";"):
+        opcode, _, operand = operation.strip().partition(" ")
+        if opcode:
+            operations[opcode] = operand.strip()
+    half_move_clock = operations.get("hmvc", "0")
+    full_move_clock = operations.get("fmvn", "1")
+    return " ".join(fields[:4] + [half_move_clock, full_move_clock]), operations
+
+
+def read_positions(path: str) -> Iterator[tuple[str, dict[str, str]]]:
+    """
+    Stream the FEN and EPD operations of every line of a file, blank lines and # comments are skipped.
+    """
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield split_epd(line)
+
+
+def load_positions(path: str, chess: Chess = None) -> Iterator[tuple[Chess, dict[str, str]]]:
+    """
+    Stream the positions of a FEN/EPD file. A single Chess instance is loaded with set_fen
+    for every line and yielded again, nothing is generated unless the caller asks for it.
+    clone() the instance to keep a position past the next iteration.
+    """
+    chess = chess if chess else Chess()
+    for fen, operations in read_positions(path):
+        chess.set_fen(fen)
+        yield chess, operations
@@ -0,0 +1,73 @@
+from utils import SQUARE_NAMES, SQUARES
+from bitboard import KNIGHT, BISHOP, ROOK, QUEEN
+
+# A move is packed into a single int:
+#   bits  0-5   start square
+#   bits  6-11  end square
+#   bits 12-14  promotion piece kind (0 when the move is not a promotion)
+#   bits 15-18  flags
+CAPTURE = 1 << 15
+DOUBLE_PUSH = 1 << 16
+EN_PASSANT = 1 << 17
+CASTLING = 1 << 18
+
+SQUARE_MASK = 63
+# start, end and promotion, what a move string describes
+MOVE_MASK = (1 << 15) - 1
+
+PROMOTION_SYMBOLS = ["", "n", "b", "r", "q"]  # indexed by piece kind
+PROMOTION_KINDS = {"": 0, "n": KNIGHT, "b": BISHOP, "r": ROOK, "q": QUEEN}
+
+# CASTLING_RIGHTS[square]: the castling rights (K, Q, k, q bits) that survive a move from or to
+# the square. Moving the king or a rook, or capturing a rook on its corner, drops the rights.
+CASTLING_RIGHTS: list[int] = [15] * 64
+CASTLING_RIGHTS[63] = 15 ^ 1  # h1
+CASTLING_RIGHTS[56] = 15 ^ 2  # a1
+CASTLING_RIGHTS[60] = 15 ^ 3  # e1
+CASTLING_RIGHTS[7] = 15 ^ 4   # h8
+CASTLING_RIGHTS[0] = 15 ^ 8   # a8
+CASTLING_RIGHTS[4] = 15 ^ 12  # e8
+
+
+def move_start(move: int) -> int:
+    return move & SQUARE_MASK
+
+
+def move_promotion(move: int) -> int:
+    return (move >> 12) & 7
+
+
+def move_to_string(move: int) -> str:
+    """
+    Convert an encoded move to algebraic notation, e.g. 'e2e4' or 'e7e8q'.
+    """
+    return f"{SQUARE_NAMES[move & SQUARE_MASK]}{SQUARE_NAMES[(move >> 6) & SQUARE_MASK]}{PROMOTION_SYMBOLS[(move >> 12) & 7]}"
+
+
+def string_to_key(move: str) -> int | None:
+    """
+    Encode the start, end and promotion of a move string without the flags,
+    compare it with `move & MOVE_MASK`. Returns None for malformed strings.
+    """
+    start, end = SQUARES.get(move[:2]), SQUARES.get(move[2:4])
+    promotion = PROMOTION_KINDS.get(move[4:])
+    if start is None or end is None or promotion is None:
+        return None
+    return start | (end << 6) | (promotion << 12)
+
+
+def castling_rook_squares(move: int) -> tuple[int, int]:
+    """
+    Start and end square of the rook for a castling move.
+    """
+    start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+    if end > start:
+        return (start | 7, end - 1)  # kingside
+    return (start & 56, end + 1)  # queenside
+
+
+def en_passant_victim(move: int) -> int:
+    """
+    Square of the pawn captured by an en passant move: the start row and the end column.
+    """
+    return (move & 56) | ((move >> 6) & 7)
@@ -0,0 +1,202 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_cli import Chess
+from moves import move_to_string
+from zobrist import SLOT_SIZE, table_mask
+
+
+class PerftTable:
+    """
+    Transposition table of subtree node counts keyed by Zobrist hash and remaining depth.
+
+    The table has a fixed number of two-entry buckets sized from a memory budget. The first
+    entry of a bucket keeps the deepest subtree stored there, since those save the most work,
+    the second one is always replaced.
+    """
+    ENTRY_SIZE = 3 * SLOT_SIZE  # key, depth and count
+
+    def __init__(self, size_mb: int):
+        # the mask selects a bucket of two entries
+        self.mask = table_mask(size_mb, 2 * self.ENTRY_SIZE)
+        size = 2 * (self.mask + 1)
+        self.keys: list[int] = [0] * size
+        self.depths: list[int] = [0] * size  # 0 marks an empty entry
+        self.counts: list[int] = [0] * size
+        self.hits = 0
+
+    def probe(self, key: int, depth: int) -> int | None:
+        index = (key & self.mask) << 1
+        if self.keys[index] == key and self.depths[index] == depth:
+            self.hits += 1
+            return self.counts[index]
+        index += 1
+        if self.keys[index] == key and self.depths[index] == depth:
+            self.hits += 1
+            return self.counts[index]
+        return None
+
+    def store(self, key: int, depth: int, count: int) -> None:
+        index = (key & self.mask) << 1
+        if depth < self.depths[index]:
+            index += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.counts[index] = count
+
+
+def count_nodes(chess: Chess, depth: int, table: PerftTable = None) -> int:
+    """
+    Number of leaf nodes `depth` plies below the current position.
+    The last ply is bulk counted: the length of the move list is the leaf count.
+    """
+    if depth <= 0:
+        return 1
+    if depth == 1:
+        return len(chess.moves)
+    if table:
+        nodes = table.probe(chess.zobrist_hash, depth)
+        if nodes is not None:
+            return nodes
+    nodes = 0
+    for move in chess.moves:
+        chess.apply_move(move)
+        nodes += count_nodes(chess, depth - 1, table)
+        chess.undo_move()
+    if table:
+        table.store(chess.zobrist_hash, depth, nodes)
+    return nodes
+
+
+def perft(fen: str, depth: int, hash_mb: int = 0) -> int:
+    """
+    `hash_mb` is the memory budget of the transposition table, 0 disables it.
+    """
+    return count_nodes(Chess(fen), depth, PerftTable(hash_mb) if hash_mb else None)
+
+
+def divide(fen: str | Chess, depth: int, hash_mb: int = 0) -> dict[str, int]:
+    """
+    Leaf node count below each root move, keyed by the move in algebraic notation.
+    `fen` may also be a Chess instance, it is searched in place. There are no root moves
+    below depth 1, the result is empty.
+    """
+    if depth < 1:
+        return {}
+    chess = fen if isinstance(fen, Chess) else Chess(fen)
+    table = PerftTable(hash_mb) if hash_mb else None
+    results = {}
+    for move in chess.moves:
+        chess.apply_move(move)
+        results[move_to_string(move)] = count_nodes(chess, depth - 1, table)
+        chess.undo_move()
+    return results
+
+
+# the table of a worker process, kept between its tasks
+_worker_table: PerftTable = None
+
+
+def count_after(task: tuple[str, list[str], int, int, bool]) -> int:
+    """
+    Worker side of parallel_divide: rebuild the position from the FEN,
+    play the given moves and count the nodes below it.
+    """
+    global _worker_table
+    fen, line, depth, hash_mb, pseudo_legal = task
+    if hash_mb and _worker_table is None:
+        _worker_table = PerftTable(hash_mb)
+    chess = Chess(fen, pseudo_legal=pseudo_legal)
+    for move in line:
+        chess.make_move(move)
+    return count_nodes(chess, depth, _worker_table)
+
+
+def moves_after(chess: Chess, line: list[str]) -> list[str]:
+    """
+    Legal moves after playing `line` from the current position, the position is left unchanged.
+    """
+    for move in line:
+        chess.make_move(move)
+    legal_moves = list(chess.legal_moves)
+    for _ in line:
+        chess.undo_move()
+    return legal_moves
+
+
+def parallel_divide(fen: str, depth: int, processes: int = None, split_depth: int = 1, hash_mb: int = 0,
+                    pseudo_legal: bool = False) -> dict[str, int]:
+    """
+    divide() spread over a process pool. The tree is split `split_depth` plies below the root
+    (1: one task per root move, 2: one task per root move and reply), every worker rebuilds
+    its own Chess from the FEN. Counts are merged per root move in generation order, so the
+    result is the same as divide() whatever order the tasks finish in.
+    With `hash_mb` every worker keeps its own transposition table of that size.
+    """
+    if depth < 1:
+        return {}
+    split_depth = max(1, min(split_depth, depth))
+    chess = Chess(fen)
+    lines = [[]]
+    for _ in range(split_depth):
+        lines = [line + [move] for line in lines for move in moves_after(chess, line)]
+
+    tasks = [(fen, line, depth - split_depth, hash_mb, pseudo_legal) for line in lines]
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        counts = pool.map(count_after, tasks,
+                          chunksize=max(1, len(tasks) // (8 * (processes or os.cpu_count()))))
+
+    results = {move: 0 for move in moves_after(chess, [])}
+    for line, count in zip(lines, counts):
+        results[line[0]] += count
+    return results
+
+
+def report(fen: str, depth: int, processes: int = 1, split_depth: int = 1, hash_mb: int = 0,
+           profile: bool = False, pseudo_legal: bool = False) -> dict[str, int]:
+    """
+    Print the divide results, the total node count and the speed in nodes/second.
+    `profile` also prints the per-phase counters, it only applies to a single process.
+    """
+    start = time.perf_counter()
+    chess = None
+    if processes == 1:
+        chess = Chess(fen, profile=profile, pseudo_legal=pseudo_legal)
+        results = divide(chess, depth, hash_mb)
+    else:
+        results = parallel_divide(fen, depth, processes, split_depth, hash_mb, pseudo_legal)
+    elapsed = time.perf_counter() - start
+    nodes = sum(results.values())
+    for move, count in results.items():
+        print(f"{move}: {count}")
+    print()
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"Nodes/second: {nodes / elapsed if elapsed else 0:.0f}")
+    if profile and chess:
+        print()
+        print(chess.profile_report())
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count the leaf nodes of the move tree.")
+    parser.add_argument("depth", type=int)
+    parser.add_argument("fen", nargs="*", help="defaults to the start position")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="worker processes, 0 for one per core")
+    parser.add_argument("--split-depth", type=int, default=1,
+                        help="plies below the root where the tree is split into tasks")
+    parser.add_argument("--hash", type=int, default=0,
+                        help="transposition table size in MB (per process), 0 disables it")
+    parser.add_argument("--profile", action="store_true",
+                        help="print call counts and time per move generation phase (single process only)")
+    parser.add_argument("--pseudo-legal", action="store_true",
+                        help="generate pseudo-legal moves and test each one for king safety")
+    args = parser.parse_intermixed_args()
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+    report(" ".join(args.fen) or None, args.depth, args.processes, args.split_depth, args.hash, args.profile,
+           args.pseudo_legal)
@@ -1,601 +1,367 @@
-from utils import notation_to_position, position_to_notation, FILES, RANKS
+from utils import SQUARE_NAMES, RAYS, DIRECTION_STEPS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, \
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS
+from bitboard import Board, FULL, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, iter_squares, square_index
+from moves import CAPTURE, DOUBLE_PUSH, EN_PASSANT, CASTLING
+
+# generation stages, see calculate_possible_moves
+ALL_MOVES = 0
+CAPTURES = 1  # captures and promotions
+QUIET_MOVES = 2  # everything else, castling included
+
+
+def slide_attacks(square: int, directions: list[int], occupied: int) -> int:
+    """
+    Bitboard of the squares a slider on `square` sees, each ray stops at (and includes) the first occupied square.
+    """
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            # the closest blocker is the lowest bit on rays towards h1 and the highest towards a8,
+            # everything behind it is the blocker's own ray in the same direction
+            if DIRECTION_STEPS[direction] > 0:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def _relevant_occupancy(square: int, directions: list[int]) -> int:
+    # the rays without their last square, a piece there cannot block anything behind it
+    mask = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        if ray:
+            last = ray.bit_length() - 1 if DIRECTION_STEPS[direction] > 0 else (ray & -ray).bit_length() - 1
+            mask |= ray ^ (1 << last)
+    return mask
+
+
+# The squares whose occupancy decides a slider's attacks, and the attack tables indexed by it:
+# ROOK_TABLES[square][occupied & ROOK_MASKS[square]]. A table entry is filled the first time
+# its occupancy is seen, most of the 4096 (rook) or 512 (bishop) entries never are.
+ROOK_MASKS: list[int] = [_relevant_occupancy(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS: list[int] = [_relevant_occupancy(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+ROOK_TABLES: list[dict[int, int]] = [{} for _ in range(64)]
+BISHOP_TABLES: list[dict[int, int]] = [{} for _ in range(64)]
+
+
+def rook_attacks(square: int, occupied: int) -> int:
+    key = occupied & ROOK_MASKS[square]
+    attacks = ROOK_TABLES[square].get(key)
+    if attacks is None:
+        attacks = ROOK_TABLES[square][key] = slide_attacks(square, ROOK_DIRECTIONS, key)
+    return attacks
+
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    key = occupied & BISHOP_MASKS[square]
+    attacks = BISHOP_TABLES[square].get(key)
+    if attacks is None:
+        attacks = BISHOP_TABLES[square][key] = slide_attacks(square, BISHOP_DIRECTIONS, key)
+    return attacks
 
 
 class Piece:
+    # no per-instance __dict__, every subclass declares empty slots as well
+    __slots__ = ("color", "side", "index", "position", "square", "position_as_notation",
+                 "possible_moves", "attacked_squares")
+    kind: int = -1
+
     def __init__(self, color: str, position: tuple[int, int]):
         self.color: str = color
+        self.side: int = WHITE if color == "w" else BLACK
+        self.index: int = self.side * 6 + self.kind  # bitboard index
         self.position: tuple[int, int] = position  # (r, c) - (rank, file)
-        self.position_as_notation: str = position_to_notation(self.position)
-        self.previous_positions: list[tuple[int, int]] = []
+        self.square: int = square_index(position)
+        self.position_as_notation: str = SQUARE_NAMES[self.square]
 
-        self.possible_moves: list[tuple[int, int]] = []
-        self.attacked_squares: list[tuple[int, int]] = []
-        self.is_enemy_king_in_vision: bool = False
+        self.possible_moves: list[int] = []  # encoded, see moves.py
+        self.attacked_squares: int = 0
 
     def move(self, pos: tuple[int, int]) -> None:
-        self.previous_positions.append(self.position)
+        """
+        Set the position, undoing a move is moving back to the start square kept in the undo record.
+        """
         self.position = pos
-        self.position_as_notation = f"{FILES[pos[1]]}{RANKS[pos[0]]}"
-
-    def undo_move(self) -> None:
-        if len(self.previous_positions) == 0:
-            return
-        last_pos = self.previous_positions.pop()
-        self.position = last_pos
-        self.position_as_notation = f"{FILES[self.position[1]]}{RANKS[self.position[0]]}"
+        self.square = pos[0] * 8 + pos[1]
+        self.position_as_notation = SQUARE_NAMES[self.square]
+
+    def copy(self) -> "Piece":
+        """
+        Independent copy of the piece, cheaper than constructing one.
+        """
+        piece = object.__new__(type(self))
+        piece.color = self.color
+        piece.side = self.side
+        piece.index = self.index
+        piece.position = self.position
+        piece.square = self.square
+        piece.position_as_notation = self.position_as_notation
+        # generation always starts a new list, so the old one can be shared
+        piece.possible_moves = self.possible_moves
+        piece.attacked_squares = self.attacked_squares
+        return piece
 
     def symbol(self) -> str:
         raise NotImplementedError(
             "This method should be implemented by subclasses.")
 
-    def move_removes_check(self, move: tuple[int, int], checking_piece: "Piece", king_square: tuple[int, int], enpassant: str) -> bool:
-        move = (move[0], move[1])
-        checking_piece_square = checking_piece.position
-        if isinstance(checking_piece, Knight):
-            return move == checking_piece_square
-        if isinstance(checking_piece, Pawn):
-            if enpassant != "-":
-                en_row, en_col = notation_to_position(enpassant)
-                if move == (en_row, en_col) and isinstance(self, Pawn):
-                    return True
-            return move == checking_piece_square
-        distance = (checking_piece.position[0] - king_square[0],
-                    checking_piece.position[1] - king_square[1])
-        direction = (distance[0]//abs(distance[0]) if distance[0] != 0 else 0,
-                     distance[1]//abs(distance[1]) if distance[1] != 0 else 0)
-        in_between_squares = []
-        for i in range(1, max(abs(distance[0]), abs(distance[1]))):
-            in_between_squares.append(
-                (king_square[0] + i * direction[0], king_square[1] + i * direction[1]))
-
-        if move in in_between_squares or move == checking_piece_square:
-            return True
-        return False
-
-    def move_brokes_pin(self, move: tuple[int, int], board: list[list["Piece"]], king_square: tuple[int, int], enpassant: str) -> bool:
-        move = (move[0], move[1])
-        pinning_pieces: list[Piece] = []
-        for r in board:
-            for piece in r:
-                if piece and piece.color != self.color and piece.is_enemy_king_in_vision:
-                    pinning_pieces.append(piece)
-        for piece in pinning_pieces:
-            distance = (piece.position[0] - king_square[0],
-                        piece.position[1] - king_square[1])
-            direction = (distance[0]//abs(distance[0]) if distance[0] != 0 else 0,
-                         distance[1]//abs(distance[1]) if distance[1] != 0 else 0)
-            in_between_squares = []
-            for i in range(1, max(abs(distance[0]), abs(distance[1]))):
-                in_between_squares.append(
-                    (king_square[0] + i * direction[0], king_square[1] + i * direction[1]))
-            if self.position not in in_between_squares:
-                continue
-
-            in_between_pieces = [board[sq[0]][sq[1]]
-                                 for sq in in_between_squares]
-            # in_between_pieces_count is minimum 1 which is self
-            in_between_pieces_count = len(
-                in_between_pieces) - in_between_pieces.count(None)
-            if in_between_pieces_count == 1:
-                if move not in in_between_squares and move != piece.position:
-                    return True
-            elif in_between_pieces_count == 2:
-                # if move is enpassant
-                if enpassant != "-":
-                    en_row, en_col = notation_to_position(enpassant)
-                    if move == (en_row, en_col) and isinstance(self, Pawn):
-                        return True
-        return False
-
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def add_moves(self, targets: int, enemies: int) -> None:
+        start = self.square
+        for square in iter_squares(targets):
+            if enemies >> square & 1:
+                self.possible_moves.append(start | (square << 6) | CAPTURE)
+            else:
+                self.possible_moves.append(start | (square << 6))
+
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
+        """
+        `attacked_squares` holds the enemy attacked squares the king could move to (only the king
+        looks at it, see Chess.get_king_danger), `check_mask` holds the squares
+        that resolve a check (all squares when not in check, none on double check) and `pins`
+        maps the square of every pinned piece to the line it may still move along.
+        `stage` limits the generation to the captures and promotions or to the quiet moves.
+        """
         raise NotImplementedError(
             "This method should be implemented by subclasses.")
 
-    def calculate_attacked_squares(self, board: list[list["Piece"]]) -> None:
+    def stage_targets(self, board: Board, stage: int) -> int:
+        """
+        Target squares allowed by a generation stage for the pieces that promote nothing.
+        """
+        if stage == CAPTURES:
+            return board.occupancy[1 - self.side]
+        if stage == QUIET_MOVES:
+            return ~board.occupied
+        return FULL
+
+    def calculate_attacked_squares(self, board: Board, occupied: int) -> None:
+        self.attacked_squares = self.get_attacks(occupied)
+
+    def get_attacks(self, occupied: int) -> int:
+        """
+        Bitboard of the squares this piece attacks with the given occupancy.
+        """
         raise NotImplementedError(
             "This method should be implemented by subclasses.")
 
 
 class Pawn(Piece):
+    __slots__ = ()
+    kind = PAWN
+
     def symbol(self) -> str:
         return "P" if self.color == 'w' else "p"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
-        # Pawns move up (-1) for white, down (+1) for black
-        direction = -1 if self.color == 'w' else 1
-
-        row, col = self.position
-        if len(checking_pieces) == 2:
+        if check_mask == 0:
             return
-
-        # Forward movement by 1
-        if (0 <= row + direction < 8) and (board[row + direction][col] is None):
-            if row + direction == 0 or row + direction == 7:
-                self.possible_moves.append((row + direction, col, "n"))
-                self.possible_moves.append((row + direction, col, "r"))
-                self.possible_moves.append((row + direction, col, "b"))
-                self.possible_moves.append((row + direction, col, "q"))
-            else:
-                self.possible_moves.append((row + direction, col, "-"))
-
+        square = self.square
+        # Pawns move up (-8) for white, down (+8) for black
+        step = -8 if self.side == WHITE else 8
+        forward = square + step
+        promotes = forward < 8 or forward >= 56
+
+        targets = 0
+        # Forward movement by 1, a promotion belongs to the captures stage
+        if not board.occupied >> forward & 1 and stage != (QUIET_MOVES if promotes else CAPTURES):
+            targets |= 1 << forward
             # Double forward movement if on starting rank
-            if ((self.position[0] == 1 and self.color == "b") or (self.position[0] == 6 and self.color == "w")) and (board[row + 2 * direction][col] is None):
-                self.possible_moves.append((row + 2 * direction, col, "-"))
+            if square >> 3 == (6 if self.side == WHITE else 1) and not board.occupied >> (forward + step) & 1:
+                if (1 << (forward + step)) & check_mask & pins.get(square, FULL):
+                    self.possible_moves.append(
+                        square | ((forward + step) << 6) | DOUBLE_PUSH)
+
+        if stage == QUIET_MOVES:
+            self.add_pawn_moves(targets & check_mask & pins.get(square, FULL), 0, promotes)
+            return
 
         # Captures
-        for dc in [-1, 1]:  # Diagonal left (-1) and right (+1)
-            new_col = col + dc
-            if (0 <= new_col < 8) and (0 <= row + direction < 8):
-                target_piece = board[row + direction][new_col]
-                if target_piece and target_piece.color != self.color:
-                    if row + direction == 0 or row + direction == 7:
-                        self.possible_moves.append(
-                            (row + direction, new_col, "n"))
-                        self.possible_moves.append(
-                            (row + direction, new_col, "r"))
-                        self.possible_moves.append(
-                            (row + direction, new_col, "b"))
-                        self.possible_moves.append(
-                            (row + direction, new_col, "q"))
-                    else:
-                        self.possible_moves.append(
-                            (row + direction, new_col, "-"))
+        enemies = board.occupancy[1 - self.side]
+        targets |= PAWN_ATTACKS[self.side][square] & enemies
+        self.add_pawn_moves(targets & check_mask & pins.get(square, FULL), enemies, promotes)
 
         # En Passant
-        if enpassant != "-":
-            en_row, en_col = notation_to_position(enpassant)
-            if abs(en_col - col) == 1 and en_row == row + direction:
-                self.possible_moves.append((en_row, en_col, "-"))
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            if not self.move_brokes_pin(move, board, king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-        if len(checking_pieces) == 0:
-            return
-
-        # Filter moves that counters the check
-        filtered_moves = []
-        for move in self.possible_moves:
-            if self.move_removes_check(move, checking_pieces[0], king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        # Pawns move up (-1) for white, down (+1) for black
-        direction = -1 if self.color == 'w' else 1
-        row, col = self.position
+        if ep_square is not None and PAWN_ATTACKS[self.side][square] >> ep_square & 1:
+            captured = ep_square - step
+            # capturing the checking pawn or blocking with the capture both resolve a check
+            if ((1 << ep_square) | (1 << captured)) & check_mask and \
+                    not self.enpassant_exposes_king(board, king_square, ep_square, captured):
+                self.possible_moves.append(
+                    square | (ep_square << 6) | CAPTURE | EN_PASSANT)
+
+    def add_pawn_moves(self, targets: int, enemies: int, promotes: bool) -> None:
+        square = self.square
+        for target in iter_squares(targets):
+            move = square | (target << 6)
+            if enemies >> target & 1:
+                move |= CAPTURE
+            if promotes:
+                self.possible_moves.append(move | (KNIGHT << 12))
+                self.possible_moves.append(move | (ROOK << 12))
+                self.possible_moves.append(move | (BISHOP << 12))
+                self.possible_moves.append(move | (QUEEN << 12))
+            else:
+                self.possible_moves.append(move)
+
+    def enpassant_exposes_king(self, board: Board, king_square: int, ep_square: int, captured: int) -> bool:
+        # both pawns leave their squares at once, so test the king directly instead of the pin table
+        occupied = (board.occupied ^ (1 << self.square) ^ (1 << captured)) | (1 << ep_square)
+        enemy = (1 - self.side) * 6
+        queens = board.bitboards[enemy + QUEEN]
+        rooks = board.bitboards[enemy + ROOK] | queens
+        bishops = board.bitboards[enemy + BISHOP] | queens
+        return bool(
+            rook_attacks(king_square, occupied) & rooks or
+            bishop_attacks(king_square, occupied) & bishops
+        )
 
-        for dc in [-1, 1]:  # Diagonal left (-1) and right (+1)
-            new_col = col + dc
-            if (0 <= new_col < 8) and (0 <= row + direction < 8):
-                self.attacked_squares.append((row + direction, new_col))
+    def get_attacks(self, occupied: int) -> int:
+        return PAWN_ATTACKS[self.side][self.square]
 
 
 class Rook(Piece):
+    __slots__ = ()
+    kind = ROOK
+
     def symbol(self):
         return "R" if self.color == 'w' else "r"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
-
-        # Define directions for rook movement (horizontal and vertical)
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1)   # Horizontal: left, right
-        ]
-
-        row, col = self.position
-        if len(checking_pieces) == 2:
+        if check_mask == 0:
             return
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-
-                if not target_piece:
-                    # If the square is empty, add it to possible moves
-                    self.possible_moves.append((new_row, new_col, "-"))
-                elif target_piece.color != self.color:
-                    # If the square contains an opponent's piece, add it and stop further movement
-                    self.possible_moves.append((new_row, new_col, "-"))
-                    break
-                else:
-                    # If the square contains a piece of the same color, stop further movement
-                    break
-
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            if not self.move_brokes_pin(move, board, king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-        if len(checking_pieces) == 0:
-            return
-
-        # Filter moves that counters the check
-        filtered_moves = []
-        for move in self.possible_moves:
-            if self.move_removes_check(move, checking_pieces[0], king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
+        targets = rook_attacks(self.square, board.occupied)
+        self.add_moves(targets & ~board.occupancy[self.side] & check_mask & pins.get(self.square, FULL) &
+                       self.stage_targets(board, stage), board.occupancy[1 - self.side])
 
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        self.is_enemy_king_in_vision = False
-
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1)   # Horizontal: left, right
-        ]
-
-        row, col = self.position
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            blocking_piece = False
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-                if not blocking_piece:
-                    self.attacked_squares.append((new_row, new_col))
-                if target_piece:
-                    blocking_piece = True
-                if target_piece and isinstance(target_piece, King) and target_piece.color != self.color:
-                    self.is_enemy_king_in_vision = True
-                    break
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
+    def get_attacks(self, occupied: int) -> int:
+        return rook_attacks(self.square, occupied)
 
 
 class Knight(Piece):
+    __slots__ = ()
+    kind = KNIGHT
+
     def symbol(self):
         return "N" if self.color == 'w' else "n"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
-
-        # Define all potential moves for a knight
-        knight_moves = [
-            (-2, -1), (-2, 1),  # Two up, one left/right
-            (-1, -2), (-1, 2),  # One up, two left/right
-            (1, -2), (1, 2),    # One down, two left/right
-            (2, -1), (2, 1)     # Two down, one left/right
-        ]
-
-        row, col = self.position
-        if len(checking_pieces) == 2:
-            return
-
-        for dr, dc in knight_moves:
-            new_row, new_col = row + dr, col + dc
-
-            # Ensure the new position is within the board bounds
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-
-                # Add the move if the target square is empty or contains an opponent's piece
-                if not target_piece or target_piece.color != self.color:
-                    self.possible_moves.append((new_row, new_col, "-"))
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            if not self.move_brokes_pin(move, board, king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-        if len(checking_pieces) == 0:
+        if check_mask == 0:
             return
+        targets = KNIGHT_ATTACKS[self.square]
+        self.add_moves(targets & ~board.occupancy[self.side] & check_mask & pins.get(self.square, FULL) &
+                       self.stage_targets(board, stage), board.occupancy[1 - self.side])
 
-        # Filter moves that counters the check
-        filtered_moves = []
-        for move in self.possible_moves:
-            if self.move_removes_check(move, checking_pieces[0], king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        # Define all potential moves for a knight
-        knight_moves = [
-            (-2, -1), (-2, 1),  # Two up, one left/right
-            (-1, -2), (-1, 2),  # One up, two left/right
-            (1, -2), (1, 2),    # One down, two left/right
-            (2, -1), (2, 1)     # Two down, one left/right
-        ]
-
-        row, col = self.position
-
-        for dr, dc in knight_moves:
-            new_row, new_col = row + dr, col + dc
-
-            # Ensure the new position is within the board bounds
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                self.attacked_squares.append((new_row, new_col))
+    def get_attacks(self, occupied: int) -> int:
+        return KNIGHT_ATTACKS[self.square]
 
 
 class Bishop(Piece):
+    __slots__ = ()
+    kind = BISHOP
+
     def symbol(self):
         return "B" if self.color == 'w' else "b"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
-
-        # Define directions for diagonal movement
-        # Top-left, top-right, bottom-left, bottom-right
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        row, col = self.position
-        if len(checking_pieces) == 2:
-            return
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-
-                if not target_piece:
-                    # If the square is empty, add it to possible moves
-                    self.possible_moves.append((new_row, new_col, "-"))
-                elif target_piece.color != self.color:
-                    # If the square contains an opponent's piece, add it and stop further movement
-                    self.possible_moves.append((new_row, new_col, "-"))
-                    break
-                else:
-                    # If the square contains a piece of the same color, stop further movement
-                    break
-
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            if not self.move_brokes_pin(move, board, king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-        if len(checking_pieces) == 0:
+        if check_mask == 0:
             return
+        targets = bishop_attacks(self.square, board.occupied)
+        self.add_moves(targets & ~board.occupancy[self.side] & check_mask & pins.get(self.square, FULL) &
+                       self.stage_targets(board, stage), board.occupancy[1 - self.side])
 
-        # Filter moves that counters the check
-        filtered_moves = []
-        for move in self.possible_moves:
-            if self.move_removes_check(move, checking_pieces[0], king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        self.is_enemy_king_in_vision = False
-        # Define directions for diagonal movement
-        # Top-left, top-right, bottom-left, bottom-right
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        row, col = self.position
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            blocking_piece = False
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-                if not blocking_piece:
-                    self.attacked_squares.append((new_row, new_col))
-                if target_piece:
-                    blocking_piece = True
-                if target_piece and isinstance(target_piece, King) and target_piece.color != self.color:
-                    self.is_enemy_king_in_vision = True
-                    break
-
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
+    def get_attacks(self, occupied: int) -> int:
+        return bishop_attacks(self.square, occupied)
 
 
 class Queen(Piece):
+    __slots__ = ()
+    kind = QUEEN
+
     def symbol(self):
         return "Q" if self.color == 'w' else "q"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
-
-        # Define directions for queen movement (horizontal, vertical, and diagonal)
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1),  # Horizontal: left, right
-            (-1, -1), (-1, 1),  # Diagonal: top-left, top-right
-            (1, -1), (1, 1)    # Diagonal: bottom-left, bottom-right
-        ]
-
-        row, col = self.position
-        if len(checking_pieces) == 2:
-            return
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-
-                if not target_piece:
-                    # If the square is empty, add it to possible moves
-                    self.possible_moves.append((new_row, new_col, "-"))
-                elif target_piece.color != self.color:
-                    # If the square contains an opponent's piece, add it and stop further movement
-                    self.possible_moves.append((new_row, new_col, "-"))
-                    break
-                else:
-                    # If the square contains a piece of the same color, stop further movement
-                    break
-
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            if not self.move_brokes_pin(move, board, king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-        if len(checking_pieces) == 0:
+        if check_mask == 0:
             return
+        targets = rook_attacks(self.square, board.occupied) | bishop_attacks(self.square, board.occupied)
+        self.add_moves(targets & ~board.occupancy[self.side] & check_mask & pins.get(self.square, FULL) &
+                       self.stage_targets(board, stage), board.occupancy[1 - self.side])
 
-        # Filter moves that counters the check
-        filtered_moves = []
-        for move in self.possible_moves:
-            if self.move_removes_check(move, checking_pieces[0], king_square, enpassant):
-                filtered_moves.append(move)
-        self.possible_moves = filtered_moves
-
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        self.is_enemy_king_in_vision = False
-
-        # Define directions for queen movement (horizontal, vertical, and diagonal)
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1),  # Horizontal: left, right
-            (-1, -1), (-1, 1),  # Diagonal: top-left, top-right
-            (1, -1), (1, 1)    # Diagonal: bottom-left, bottom-right
-        ]
-
-        row, col = self.position
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            blocking_piece = False
-            while 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-                if not blocking_piece:
-                    self.attacked_squares.append((new_row, new_col))
-                if target_piece:
-                    blocking_piece = True
-                if target_piece and isinstance(target_piece, King) and target_piece.color != self.color:
-                    self.is_enemy_king_in_vision = True
-                    break
-
-                # Move further in the current direction
-                new_row += dr
-                new_col += dc
+    def get_attacks(self, occupied: int) -> int:
+        return rook_attacks(self.square, occupied) | bishop_attacks(self.square, occupied)
 
 
 class King(Piece):
+    __slots__ = ()
+    kind = KING
+
     def symbol(self):
         return "K" if self.color == 'w' else "k"
 
-    def calculate_possible_moves(self, board: list[list["Piece"]], attacked_squares: dict[str, list[tuple[int, int]]], checking_pieces: list["Piece"], king_square: tuple[int, int], castling: str = "-", enpassant: str = "-") -> None:
+    def calculate_possible_moves(self, board: Board, attacked_squares: int, check_mask: int, pins: dict[int, int], king_square: int, castling: int = 0, ep_square: int | None = None, stage: int = ALL_MOVES) -> None:
         self.possible_moves = []  # Clear previous moves
 
-        # Define all possible movement directions for the king
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1),  # Horizontal: left, right
-            (-1, -1), (-1, 1),  # Diagonal: top-left, top-right
-            (1, -1), (1, 1)    # Diagonal: bottom-left, bottom-right
-        ]
+        # the attacks are computed with this king off the board, so stepping
+        # away from a slider's check is already excluded here
+        targets = KING_ATTACKS[self.square] & \
+            ~board.occupancy[self.side] & ~attacked_squares & self.stage_targets(board, stage)
+        self.add_moves(targets, board.occupancy[1 - self.side])
+        if stage == CAPTURES:
+            return
 
-        asf = list(set([m for _, squares in attacked_squares.items()
-                   for m in squares]))
+        start = self.square
         row, col = self.position
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                target_piece = board[new_row][new_col]
-                if (new_row, new_col) in asf:
-                    continue
-                if not target_piece or target_piece.color != self.color:
-                    # Add square if empty or occupied by opponent
-                    self.possible_moves.append((new_row, new_col, "-"))
-
         # Check castling possibilities
         if self.color == 'w':
             if self.position_as_notation == "e1":
                 # White castling
-                if castling[0] and self.can_castle_kingside(board, asf, row, col):
-                    self.possible_moves.append((row, col + 2, "-"))
-                if castling[1] and self.can_castle_queenside(board, asf, row, col):
-                    self.possible_moves.append((row, col - 2, "-"))
+                if castling & 1 and self.can_castle_kingside(board, attacked_squares, row, col):
+                    self.possible_moves.append(start | ((start + 2) << 6) | CASTLING)
+                if castling & 2 and self.can_castle_queenside(board, attacked_squares, row, col):
+                    self.possible_moves.append(start | ((start - 2) << 6) | CASTLING)
         else:
             if self.position_as_notation == "e8":
                 # Black castling
-                if castling[2] and self.can_castle_kingside(board, asf, row, col):
-                    self.possible_moves.append((row, col + 2, "-"))
-                if castling[3] and self.can_castle_queenside(board, asf, row, col):
-                    self.possible_moves.append((row, col - 2, "-"))
+                if castling & 4 and self.can_castle_kingside(board, attacked_squares, row, col):
+                    self.possible_moves.append(start | ((start + 2) << 6) | CASTLING)
+                if castling & 8 and self.can_castle_queenside(board, attacked_squares, row, col):
+                    self.possible_moves.append(start | ((start - 2) << 6) | CASTLING)
 
-        if len(checking_pieces) == 0:
-            return
-
-        filtered_moves = []
-        for move in self.possible_moves:
-            legal = True
-            for checking_piece in checking_pieces:
-                if not isinstance(checking_piece, (Knight, Pawn)):
-                    checking_piece_square = checking_piece.position
-                    direction = (
-                        checking_piece_square[0] - king_square[0], checking_piece_square[1] - king_square[1])
-                    opposite_direction = (0 if direction[0] == 0 else -(direction[0]/abs(
-                        direction[0])), 0 if direction[1] == 0 else -(direction[1]/abs(direction[1])))
-                    if move == (king_square[0] + opposite_direction[0], king_square[1] + opposite_direction[1], "-"):
-                        legal = False
-                        break
-            if legal:
-                filtered_moves.append(move)
-
-        self.possible_moves = filtered_moves
-
-    def can_castle_kingside(self, board: list[list["Piece"]], attacked_squares: list[tuple[int, int]], row: int, col: int) -> bool:
+    def can_castle_kingside(self, board: Board, attacked_squares: int, row: int, col: int) -> bool:
         # Check if squares between king and kingside rook are empty, not attacked and rook is unmoved
-
+        square = row * 8 + col
+        path = (1 << (square + 1)) | (1 << (square + 2))
+        rook = board.squares[row * 8 + 7]
         return (
             # cannot castle through check
-            (row, col) not in attacked_squares and
-            board[row][col + 1] is None and (row, col + 1) not in attacked_squares and
-            board[row][col + 2] is None and (row, col + 2) not in attacked_squares and
-            isinstance(board[row][7], Rook) and
-            board[row][7].color == self.color
+            not attacked_squares & ((1 << square) | path) and
+            not board.occupied & path and
+            isinstance(rook, Rook) and
+            rook.color == self.color
         )
 
-    def can_castle_queenside(self, board: list[list["Piece"]], attacked_squares: list[tuple[int, int]], row: int, col: int) -> bool:
+    def can_castle_queenside(self, board: Board, attacked_squares: int, row: int, col: int) -> bool:
         # Check if squares between king and queenside rook are empty, not attacked and rook is unmoved
-
+        square = row * 8 + col
+        path = (1 << (square - 1)) | (1 << (square - 2))
+        rook = board.squares[row * 8]
         return (
             # cannot castle through check
-            (row, col) not in attacked_squares and
-            board[row][col - 1] is None and (row, col - 1) not in attacked_squares and
-            board[row][col - 2] is None and (row, col - 2) not in attacked_squares and
-            board[row][col - 3] is None and (row, col - 3) not in attacked_squares and
-            isinstance(board[row][0], Rook) and
-            board[row][0].color == self.color
+            not attacked_squares & ((1 << square) | path) and
+            not board.occupied & (path | (1 << (square - 3))) and
+            isinstance(rook, Rook) and
+            rook.color == self.color
         )
 
-    def calculate_attacked_squares(self, board: list[list["Piece"]]):
-        self.attacked_squares = []
-        # Define all possible movement directions for the king
-        directions = [
-            (-1, 0), (1, 0),  # Vertical: up, down
-            (0, -1), (0, 1),  # Horizontal: left, right
-            (-1, -1), (-1, 1),  # Diagonal: top-left, top-right
-            (1, -1), (1, 1)    # Diagonal: bottom-left, bottom-right
-        ]
-
-        row, col = self.position
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                self.attacked_squares.append((new_row, new_col))
+    def get_attacks(self, occupied: int) -> int:
+        return KING_ATTACKS[self.square]
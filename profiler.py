@@ -0,0 +1,83 @@
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from chess_cli import Chess
+
+# the Chess methods that are timed, in the order they are reported
+PHASES = [
+    "update_attacked_squares",
+    "get_king_danger",
+    "attackers_to",
+    "check_check",
+    "get_pins",
+    "get_possible_moves",
+    "get_pseudo_legal_moves",
+    "is_legal",
+    "is_game_over",
+    "parse_move",
+    "apply_move",
+    "undo_move",
+]
+
+
+class PhaseProfiler:
+    """
+    Call counts, cumulative time and generated moves per phase of one Chess instance.
+
+    While enabled every phase method is shadowed by a timing wrapper stored on the instance,
+    disabling removes the wrappers again so the class methods run untouched. Times are
+    inclusive: get_possible_moves also counts the king danger and pin updates it triggers,
+    check_check and is_legal the attackers_to queries they make.
+    """
+
+    def __init__(self, chess: "Chess"):
+        self.chess = chess
+        self.enabled = False
+        self.calls: dict[str, int] = dict.fromkeys(PHASES, 0)
+        self.times: dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.moves: dict[str, int] = dict.fromkeys(PHASES, 0)
+
+    def reset(self) -> None:
+        # cleared in place, the wrappers hold on to these dicts
+        for phase in PHASES:
+            self.calls[phase] = 0
+            self.times[phase] = 0.0
+            self.moves[phase] = 0
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        for phase in PHASES:
+            setattr(self.chess, phase, self.wrap(phase, getattr(self.chess, phase)))
+        self.enabled = True
+
+    def disable(self) -> None:
+        for phase in PHASES:
+            self.chess.__dict__.pop(phase, None)
+        self.enabled = False
+
+    def wrap(self, phase: str, method):
+        calls, times, moves = self.calls, self.times, self.moves
+        chess = self.chess
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = method(*args, **kwargs)
+            times[phase] += perf_counter() - start
+            calls[phase] += 1
+            if phase == "get_possible_moves":
+                moves[phase] += len(chess._moves)
+            elif phase == "get_pseudo_legal_moves":
+                moves[phase] += len(chess._pseudo_legal_moves)
+            return result
+
+        return timed
+
+    def report(self) -> str:
+        lines = [f"{'phase': <24}{'calls': >10}{'time (s)': >12}{'us/call': >10}{'moves': >10}"]
+        for phase in PHASES:
+            calls, seconds = self.calls[phase], self.times[phase]
+            per_call = seconds / calls * 1e6 if calls else 0
+            lines.append(f"{phase: <24}{calls: >10}{seconds: >12.4f}{per_call: >10.1f}{self.moves[phase]: >10}")
+        return "\n".join(lines)
@@ -0,0 +1,295 @@
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+from chess_cli import Chess, START_FEN
+from epd import split_epd
+from evaluation import evaluate_from_scratch
+from moves import move_to_string
+from perft import divide
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests")
+BASELINE_PATH = os.path.join(TESTS_DIR, "baseline.json")
+# iterations of the calibration workload, about 20 ms
+CALIBRATION_LOOPS = 50_000
+# plies of the random game played by check_consistency from every position
+CONSISTENCY_PLIES = 150
+# check_consistency tests the round trips of the position every this many plies
+ROUND_TRIP_INTERVAL = 7
+# fail when a position runs below this fraction of its baseline relative speed, single runs
+# on an unchanged tree stay above it (see --update-baseline for how the baseline is taken)
+DEFAULT_TOLERANCE = 0.6
+# timing runs per position the baseline is the median of
+BASELINE_RUNS = 5
+# exit status of the command line: the counts differ, or they match but a position was too slow
+COUNTS_FAILED, TOO_SLOW = 1, 2
+
+# the lines written by test.py: fen = '...', depth = N and '✅ e2e4 : 405385 - 405385'
+fen_line_matcher = re.compile(r"fen = '(.+)'")
+depth_line_matcher = re.compile(r"depth = (\d+)")
+move_count_line_matcher = re.compile(
+    r"\S+ ([a-h][1-8][a-h][1-8][qrnb]?) *: *(\d+|-) - *(\d+|-)")
+
+
+def parse_golden(path: str) -> tuple[str, int, dict[str, int]]:
+    """
+    Read a test.py result file, returns the FEN, the depth and the Stockfish divide counts.
+    """
+    fen, depth, counts = None, None, {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if res := fen_line_matcher.match(line):
+                fen = res.group(1)
+            elif res := depth_line_matcher.match(line):
+                depth = int(res.group(1))
+            elif res := move_count_line_matcher.match(line):
+                move, stockfish_count, _ = res.groups()
+                if stockfish_count != "-":
+                    counts[move] = int(stockfish_count)
+    if fen is None or depth is None:
+        raise ValueError(f"{path}: missing fen or depth")
+    return fen, depth, counts
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Loops/second of a fixed workload of integer, list and attribute operations like the ones of
+    move generation, the best of `repeat` runs. Speeds are compared relative to it, so that the
+    baseline carries over to other machines and to a machine under load.
+    """
+    class Holder:
+        __slots__ = ("value",)
+
+    holder, table = Holder(), list(range(64))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        holder.value = 0
+        for i in range(CALIBRATION_LOOPS):
+            bit = 1 << table[i & 63]
+            holder.value = (holder.value ^ bit) & ~(bit >> 1) | (i & 7)
+        best = min(best, time.perf_counter() - start)
+    return CALIBRATION_LOOPS / best
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(baseline: dict[str, float], path: str = BASELINE_PATH) -> None:
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=4, sort_keys=True)
+        file.write("\n")
+
+
+def time_divide(fen: str, depth: int) -> tuple[dict[str, int], float, float]:
+    """
+    divide() timed, returns its results, the seconds it took and its relative speed: nodes per
+    calibration loop.
+    """
+    calibration = calibrate()
+    start = time.perf_counter()
+    results = divide(fen, depth)
+    elapsed = time.perf_counter() - start
+    # the load can change during a long position, calibrate on both sides of it
+    calibration = (calibration + calibrate()) / 2
+    nps = sum(results.values()) / elapsed if elapsed else 0
+    return results, elapsed, nps / calibration
+
+
+def check_position(path: str, baseline: dict[str, float], tolerance: float,
+                   runs: int = 1) -> tuple[bool, bool, float]:
+    """
+    Compare divide() with the golden counts of one file and time it `runs` times. Returns whether
+    the counts match, whether it was fast enough and the median relative speed.
+    """
+    name = os.path.basename(path)
+    fen, depth, expected = parse_golden(path)
+    results, elapsed, relative = time_divide(fen, depth)
+    speeds = [relative] + [time_divide(fen, depth)[2] for _ in range(runs - 1)]
+    relative = statistics.median(speeds)
+    nodes = sum(results.values())
+    nps = nodes / elapsed if elapsed else 0
+
+    counts_passed = True
+    for move in sorted(set(expected) | set(results)):
+        if expected.get(move) != results.get(move):
+            print(f"❌ {move: <5}: {str(expected.get(move, '-')): >8} - {str(results.get(move, '-')): >8}")
+            counts_passed = False
+
+    fast_enough = True
+    speed = f"{nps:.0f} nodes/s, {relative:.3f} relative"
+    if runs > 1:
+        speed += f" (median of {' '.join(f'{value:.3f}' for value in speeds)})"
+    if name in baseline:
+        speed += f" (baseline {baseline[name]:.3f})"
+        if tolerance and relative < baseline[name] * tolerance:
+            speed += " too slow"
+            fast_enough = False
+    print(f"{'✅' if counts_passed and fast_enough else '❌'} {name}: depth {depth}, {nodes} nodes, "
+          f"{elapsed:.2f}s, {speed}")
+    return counts_passed, fast_enough, relative
+
+
+def check_consistency(fen: str, plies: int = CONSISTENCY_PLIES, seed: int = 0) -> bool:
+    """
+    Play a random game from `fen` and take it back, checking at every ply that the capture and
+    quiet stages split the legal moves between them, that the chosen move can still be made
+    from its string once they were generated, and that the incremental Zobrist hash and
+    evaluation equal the ones computed from scratch. Every few plies the position also goes
+    through check_round_trips. Taking the game back must give every earlier FEN again.
+    Returns whether every check held.
+    """
+    chess = Chess(fen)
+    rng = random.Random(seed)
+    fens = []
+    for ply in range(plies):
+        fens.append(chess.to_fen())
+        if not check_incremental(chess):
+            return False
+        if ply % ROUND_TRIP_INTERVAL == ROUND_TRIP_INTERVAL - 1 and not check_round_trips(chess, rng, fens):
+            return False
+        moves = chess.moves
+        if not moves:
+            break
+        # the stages regenerate the pieces' move lists, make_move must still find every move
+        captures, quiets = chess.capture_moves(), chess.quiet_moves()
+        if sorted(captures + quiets) != sorted(moves):
+            print(f"❌ {chess.to_fen()}: captures and quiet moves do not add up to the legal moves")
+            return False
+        move = rng.choice(moves)
+        if not chess.make_move(move_to_string(move)) or chess.history[-1].move != move:
+            print(f"❌ {chess.to_fen()}: {move_to_string(move)} could not be made after generating the stages")
+            return False
+    while chess.history:
+        chess.undo_move()
+        if chess.to_fen() != fens[len(chess.history)]:
+            print(f"❌ {chess.to_fen()}: taking the game back gave this instead of {fens[len(chess.history)]}")
+            return False
+        if not check_incremental(chess):
+            return False
+    return True
+
+
+def same_position(chess: Chess, other: Chess) -> bool:
+    return chess.to_fen() == other.to_fen() and chess.zobrist_hash == other.zobrist_hash and \
+        chess.evaluate() == other.evaluate() and sorted(chess.moves) == sorted(other.moves)
+
+
+def check_round_trips(chess: Chess, rng: random.Random, fens: list[str]) -> bool:
+    """
+    The current position (the last of `fens`, the earlier ones lead to it) must come back
+    unchanged from FEN and EPD text and from clone(). snapshot() must bring it back after
+    set_fen() and after a few moves are taken back and others played instead, after which
+    undo_move must give the previous FEN again. The position is left as it was.
+    """
+    fen = fens[-1]
+    fields = fen.split()
+    epd_fen, _ = split_epd(" ".join(fields[:4]) + f" bm e4; hmvc {fields[4]}; fmvn {fields[5]};")
+    fresh = Chess()
+    fresh.set_fen(epd_fen)
+    if not same_position(fresh, Chess(fen)) or Chess(fen).to_fen() != fen:
+        print(f"❌ {fen}: FEN or EPD round trip changed the position")
+        return False
+
+    clone = chess.clone()
+    if not same_position(clone, fresh):
+        print(f"❌ {fen}: clone differs from the position")
+        return False
+    if clone.moves:
+        clone.apply_move(clone.moves[0])
+    if chess.to_fen() != fen:
+        print(f"❌ {fen}: a move on the clone changed the position")
+        return False
+
+    snapshot = chess.snapshot()
+    chess.set_fen(START_FEN)
+    chess.restore(snapshot)
+    if not same_position(chess, fresh):
+        print(f"❌ {fen}: restore() after set_fen() gave {chess.to_fen()}")
+        return False
+    back = min(3, len(chess.history))
+    for _ in range(back):
+        chess.undo_move()
+    for _ in range(back):
+        if chess.moves:
+            chess.apply_move(rng.choice(chess.moves))
+    chess.restore(snapshot)
+    if not same_position(chess, fresh) or not check_incremental(chess):
+        print(f"❌ {fen}: restore() gave {chess.to_fen()}")
+        return False
+    if chess.history:
+        chess.undo_move()
+        if chess.to_fen() != fens[-2] or not check_incremental(chess):
+            print(f"❌ {fen}: undo after restore() gave {chess.to_fen()} instead of {fens[-2]}")
+            return False
+        chess.restore(snapshot)
+    return True
+
+
+def check_incremental(chess: Chess) -> bool:
+    if chess.zobrist_hash != chess.compute_zobrist_hash():
+        print(f"❌ {chess.to_fen()}: incremental Zobrist hash differs from the one computed from scratch")
+        return False
+    if chess.evaluate() != evaluate_from_scratch(chess):
+        print(f"❌ {chess.to_fen()}: incremental evaluation {chess.evaluate()} differs from "
+              f"{evaluate_from_scratch(chess)} computed from scratch")
+        return False
+    return True
+
+
+def run(paths: list[str], max_nodes: int = 0, tolerance: float = DEFAULT_TOLERANCE,
+        update_baseline: bool = False, runs: int = 1) -> tuple[bool, bool]:
+    """
+    Play the consistency games, then check every golden file, files with more than `max_nodes`
+    nodes are skipped (0: no limit). Returns whether all the counts matched and whether every
+    position ran at least `tolerance` times its baseline relative speed (0: no speed check).
+    Every position is timed `runs` times and judged, or stored, by the median.
+    """
+    baseline = load_baseline()
+    fens = [START_FEN] + [parse_golden(path)[0] for path in paths]
+    counts_passed = all([check_consistency(fen, seed=seed) for seed, fen in enumerate(fens)])
+    print(f"{'✅' if counts_passed else '❌'} consistency: {len(fens)} random games of up to {CONSISTENCY_PLIES} plies")
+    fast_enough = True
+    for path in paths:
+        _, _, expected = parse_golden(path)
+        if max_nodes and sum(expected.values()) > max_nodes:
+            print(f"- {os.path.basename(path)}: skipped, {sum(expected.values())} nodes")
+            continue
+        counts, fast, relative = check_position(path, baseline, tolerance, runs)
+        counts_passed &= counts
+        fast_enough &= fast
+        if update_baseline:
+            baseline[os.path.basename(path)] = round(relative, 4)
+    if update_baseline:
+        save_baseline(baseline)
+    return counts_passed, fast_enough
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the perft divide counts against the golden files in tests/, no Stockfish needed.")
+    parser.add_argument("files", nargs="*", help="defaults to tests/*.txt")
+    parser.add_argument("--max-nodes", type=int, default=0,
+                        help="skip positions with more nodes than this, 0 for no limit")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fail (exit status 2) when the speed relative to the calibration loop is below "
+                             "this fraction of the baseline, 0 only reports the speeds")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help=f"store the measured speeds as the new baseline, the median of {BASELINE_RUNS} runs "
+                             "unless --runs is given")
+    parser.add_argument("--runs", type=int, help="timing runs per position, the median is kept (default 1)")
+    args = parser.parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(TESTS_DIR, "*.txt")))
+    runs = max(1, args.runs or (BASELINE_RUNS if args.update_baseline else 1))
+    counts_passed, fast_enough = run(files, args.max_nodes, args.tolerance, args.update_baseline, runs)
+    sys.exit(COUNTS_FAILED if not counts_passed else TOO_SLOW if not fast_enough else 0)
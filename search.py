@@ -0,0 +1,314 @@
+import argparse
+import sys
+import time
+
+from chess_cli import Chess
+from evaluation import PIECE_VALUES
+from moves import CAPTURE, EN_PASSANT, SQUARE_MASK, move_to_string
+from zobrist import SLOT_SIZE, table_mask
+
+INFINITY = 1_000_000
+MATE = 100_000
+# scores beyond this are mates, stored in the table relative to the node instead of the root
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+# the clock is read every this many nodes plus one, the node limit is checked at every node
+CLOCK_MASK = 63
+
+# transposition table entry bounds
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# move ordering scores, see Search.order_moves
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORES = (1 << 27, (1 << 27) - 1)
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the tree when a node or time limit is hit or stop is requested.
+    """
+
+
+class TranspositionTable:
+    """
+    Search results keyed by Zobrist hash: depth, score, bound and best move. One entry per
+    slot, a position replaces the entry of another one unless that one was searched deeper.
+    """
+    ENTRY_SIZE = 5 * SLOT_SIZE  # key, depth, score, bound and move
+
+    def __init__(self, size_mb: int = 16):
+        self.mask = table_mask(size_mb, self.ENTRY_SIZE)
+        size = self.mask + 1
+        self.keys: list[int] = [0] * size
+        self.depths: list[int] = [-1] * size  # -1 marks an empty entry
+        self.scores: list[int] = [0] * size
+        self.bounds: list[int] = [EXACT] * size
+        self.moves: list[int] = [0] * size
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        """
+        (depth, score, bound, move) stored for the position, None if there is none.
+        """
+        index = key & self.mask
+        if self.keys[index] != key or self.depths[index] < 0:
+            return None
+        return self.depths[index], self.scores[index], self.bounds[index], self.moves[index]
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: int) -> None:
+        index = key & self.mask
+        if self.keys[index] != key and depth < self.depths[index]:
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.moves[index] = move
+
+    def clear(self) -> None:
+        size = self.mask + 1
+        self.keys = [0] * size
+        self.depths = [-1] * size
+
+
+class Search:
+    """
+    Iterative deepening negamax with alpha-beta pruning, a quiescence search over the captures,
+    a transposition table and move ordering by table move, captures (most valuable victim,
+    least valuable attacker), killer moves and the history heuristic.
+    The moves are made on the given Chess with apply_move/undo_move, it is left as it was.
+    """
+
+    def __init__(self, chess: Chess, hash_mb: int = 16):
+        self.chess = chess
+        self.table = TranspositionTable(hash_mb)
+        # set from another thread to end the search, the best move so far is kept
+        self.stopped = False
+
+        self.nodes = 0
+        self.node_limit = sys.maxsize
+        self.deadline = 0.0
+        self.start_time = 0.0
+        self.killers: list[list[int]] = [[0, 0] for _ in range(MAX_PLY)]
+        # history[side][start << 6 | end]: how often the quiet move caused a cutoff, deeper counts more
+        self.history: list[list[int]] = [[0] * 4096, [0] * 4096]
+        # triangular principal variation table, pv[ply] is the best line from that ply
+        self.pv: list[list[int]] = [[] for _ in range(MAX_PLY + 1)]
+
+    def search(self, depth: int = None, nodes: int = None, movetime: float = None,
+               info=print) -> tuple[int | None, int]:
+        """
+        Search up to `depth` plies, `nodes` nodes or `movetime` seconds, whichever comes first.
+        Without a depth the search goes on until another limit or stop, a depth below 1 searches 1 ply.
+        `info` receives a line per completed iteration with depth, score, nodes, nps, time and pv.
+        Returns the best move (None when there is no legal move) and its score in centipawns.
+        """
+        chess = self.chess
+        root_ply = len(chess.history)
+        self.stopped = False
+        self.nodes = 0
+        self.node_limit = nodes or sys.maxsize
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + movetime if movetime else 0.0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+
+        best_move, best_score = (chess.moves[0] if chess.moves else None), 0
+        max_depth = MAX_PLY if depth is None else max(1, min(depth, MAX_PLY))
+        for iteration in range(1, max_depth + 1):
+            try:
+                score = self.negamax(iteration, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                # unwind the moves the interrupted iteration left on the board
+                while len(chess.history) > root_ply:
+                    chess.undo_move()
+                break
+            if self.pv[0]:
+                best_move, best_score = self.pv[0][0], score
+            if info:
+                info(self.info_line(iteration, score))
+            if abs(score) > MATE_BOUND or not chess.moves:
+                break
+        return best_move, best_score
+
+    def info_line(self, depth: int, score: int) -> str:
+        elapsed = time.perf_counter() - self.start_time
+        if abs(score) > MATE_BOUND:
+            # moves, not plies, to the mate
+            plies = MATE - abs(score)
+            score_text = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+        else:
+            score_text = f"cp {score}"
+        return (f"info depth {depth} score {score_text} nodes {self.nodes} "
+                f"nps {int(self.nodes / elapsed) if elapsed else 0} time {int(elapsed * 1000)} "
+                f"pv {' '.join(move_to_string(move) for move in self.pv[0])}")
+
+    def check_limits(self) -> None:
+        if self.stopped or self.nodes >= self.node_limit or \
+                (self.deadline and time.perf_counter() >= self.deadline):
+            self.stopped = True
+            raise SearchAborted
+
+    def is_draw(self) -> bool:
+        """
+        Fifty move rule or a repetition since the last capture or pawn move.
+        """
+        chess = self.chess
+        if chess.half_move_clock >= 100:
+            return True
+        history = chess.history
+        key = chess.zobrist_hash
+        # only positions with the same side to move, no further back than the halfmove clock
+        for index in range(len(history) - 2, max(-1, len(history) - 1 - chess.half_move_clock), -2):
+            if history[index].hash == key:
+                return True
+        return False
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        chess = self.chess
+        self.nodes += 1
+        if self.nodes >= self.node_limit or not self.nodes & CLOCK_MASK:
+            self.check_limits()
+        self.pv[ply] = []
+        if ply and self.is_draw():
+            return 0
+
+        key = chess.zobrist_hash
+        entry = self.table.probe(key)
+        tt_move = 0
+        if entry:
+            entry_depth, score, bound, tt_move = entry
+            if ply and entry_depth >= depth:
+                score = score - ply if score > MATE_BOUND else score + ply if score < -MATE_BOUND else score
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    if alpha < score < beta:
+                        # the score becomes part of the principal variation, which the cutoff did not search
+                        self.pv[ply] = self.table_line(tt_move, entry_depth)
+                    return score
+
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(alpha, beta, ply)
+
+        moves = chess.moves
+        if not moves:
+            return -MATE + ply if chess.checking_pieces else 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, 0
+        for move in self.order_moves(moves, tt_move, ply):
+            chess.apply_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            chess.undo_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        if not move & CAPTURE and not move >> 12 & 7:
+                            self.update_quiet_cutoff(move, depth, ply)
+                        break
+
+        bound = LOWER if best_score >= beta else EXACT if best_score > original_alpha else UPPER
+        stored = best_score + ply if best_score > MATE_BOUND else best_score - ply if best_score < -MATE_BOUND else best_score
+        self.table.store(key, depth, stored, bound, best_move)
+        return best_score
+
+    def table_line(self, move: int, length: int) -> list[int]:
+        """
+        The line of best moves stored in the table from the current position, starting with `move`:
+        up to `length` moves, as long as they are legal and no position repeats.
+        """
+        chess = self.chess
+        line, seen = [], set()
+        while move and len(line) < length and chess.zobrist_hash not in seen and move in chess.moves:
+            seen.add(chess.zobrist_hash)
+            chess.apply_move(move)
+            line.append(move)
+            entry = self.table.probe(chess.zobrist_hash)
+            move = entry[3] if entry else 0
+        for _ in line:
+            chess.undo_move()
+        return line
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """
+        Search the captures and promotions until the position is quiet, every position may
+        stand pat on its evaluation. In check every move is searched and there is no standing pat.
+        """
+        chess = self.chess
+        self.nodes += 1
+        if self.nodes >= self.node_limit or not self.nodes & CLOCK_MASK:
+            self.check_limits()
+        self.pv[ply] = []
+        if ply >= MAX_PLY - 1:
+            return chess.evaluate()
+
+        in_check = bool(chess.checking_pieces)
+        if in_check:
+            moves = chess.moves
+            if not moves:
+                return -MATE + ply
+            best_score = -INFINITY
+        else:
+            best_score = chess.evaluate()
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+            moves = chess.capture_moves()
+
+        for move in self.order_moves(moves, 0, ply):
+            chess.apply_move(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            chess.undo_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def order_moves(self, moves: list[int], tt_move: int, ply: int) -> list[int]:
+        squares = self.chess.board.squares
+        killers = self.killers[ply]
+        history = self.history[self.chess.turn]
+        scores = {}
+        for move in moves:
+            if move == tt_move:
+                scores[move] = TT_MOVE_SCORE
+            elif move & CAPTURE or move >> 12 & 7:
+                start, end = move & SQUARE_MASK, (move >> 6) & SQUARE_MASK
+                victim = 0 if move & EN_PASSANT else PIECE_VALUES[squares[end].kind] if move & CAPTURE else 0
+                promotion = PIECE_VALUES[move >> 12 & 7] if move >> 12 & 7 else 0
+                scores[move] = CAPTURE_SCORE + 10 * (victim + promotion) - squares[start].kind
+            elif move == killers[0]:
+                scores[move] = KILLER_SCORES[0]
+            elif move == killers[1]:
+                scores[move] = KILLER_SCORES[1]
+            else:
+                scores[move] = history[move & 4095]
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def update_quiet_cutoff(self, move: int, depth: int, ply: int) -> None:
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[self.chess.turn][move & 4095] += depth * depth
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search a position for the best move.")
+    parser.add_argument("fen", nargs="*", help="defaults to the start position")
+    parser.add_argument("-d", "--depth", type=int, help="maximum depth in plies")
+    parser.add_argument("-n", "--nodes", type=int, help="maximum number of nodes")
+    parser.add_argument("-t", "--movetime", type=float, help="maximum time in seconds")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    args = parser.parse_intermixed_args()
+
+    chess = Chess(" ".join(args.fen) or None)
+    depth = args.depth if args.depth is not None or args.nodes or args.movetime else 5
+    best_move, score = Search(chess, args.hash).search(depth, args.nodes, args.movetime)
+    print(f"bestmove {move_to_string(best_move) if best_move is not None else '(none)'}")
@@ -0,0 +1,187 @@
+import sys
+import threading
+import time
+
+from chess_cli import Chess, START_FEN
+from moves import move_to_string, string_to_key
+from perft import divide
+from search import Search, TranspositionTable
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+# moves the remaining clock time is shared between when the GUI does not say
+DEFAULT_MOVES_TO_GO = 30
+
+
+class UCIEngine:
+    """
+    Universal Chess Interface front end: commands are read on the stdin thread and the search
+    runs on a thread of its own, so that stop is handled while it is running.
+    A single Chess is kept for the whole session, `position ... moves` only plays the moves
+    that are new since the last position, see set_position.
+    """
+
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.chess = Chess()
+        self.search = Search(self.chess, DEFAULT_HASH_MB)
+        self.thread: threading.Thread | None = None
+        # the position the Chess holds: start FEN and the moves played from it
+        self.fen = START_FEN
+        self.moves: list[str] = []
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def loop(self, lines=None) -> None:
+        for line in lines or sys.stdin:
+            if not self.handle(line):
+                break
+        self.stop()
+
+    def handle(self, line: str) -> bool:
+        """
+        Run one command, False after quit. Unknown commands are ignored as the protocol asks.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name Berk's Chess")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stop()
+            self.setoption(args)
+        elif command == "ucinewgame":
+            self.stop()
+            self.search.table.clear()
+            self.set_position(START_FEN, [])
+        elif command == "position":
+            self.stop()
+            self.position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            return False
+        return True
+
+    def setoption(self, args: list[str]) -> None:
+        # setoption name <name> [value <value>]
+        if "name" not in args:
+            return
+        value_index = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:value_index]).lower()
+        value = " ".join(args[value_index + 1:])
+        if name == "hash" and value.isdigit():
+            self.search.table = TranspositionTable(max(1, min(int(value), MAX_HASH_MB)))
+
+    def position(self, args: list[str]) -> None:
+        # position startpos | fen <fen> [moves <move> ...]
+        moves_index = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:moves_index])
+        else:
+            fen = START_FEN
+        self.set_position(fen, args[moves_index + 1:])
+
+    def set_position(self, fen: str, moves: list[str]) -> None:
+        """
+        Bring the Chess to the position after `moves` from `fen`. Moves the current position
+        shares with the new one are kept, only the ones past the common part are undone or played,
+        so a game sent move by move costs one move per command.
+        A FEN that cannot be read is reported and the previous position is kept.
+        """
+        chess = self.chess
+        common = 0
+        if fen == self.fen:
+            while common < min(len(moves), len(self.moves)) and moves[common] == self.moves[common]:
+                common += 1
+            for _ in range(len(self.moves) - common):
+                chess.undo_move()
+        else:
+            snapshot = chess.snapshot()
+            try:
+                chess.set_fen(fen)
+                if None in chess.kings:
+                    raise ValueError("missing king")
+            except (ValueError, IndexError) as error:
+                chess.restore(snapshot)
+                self.send(f"info string invalid fen {fen} ({error})")
+                return
+        self.fen, self.moves = fen, self.moves[:common]
+
+        for move in moves[common:]:
+            # checked here, parse_move prints about malformed strings and the GUI reads stdout
+            if string_to_key(move) is None or not chess.make_move(move):
+                self.send(f"info string illegal move {move}")
+                break
+            self.moves.append(move)
+
+    def go(self, args: list[str]) -> None:
+        options = {}
+        for index, token in enumerate(args):
+            if token in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "perft") \
+                    and index + 1 < len(args) and args[index + 1].lstrip("-").isdigit():
+                options[token] = int(args[index + 1])
+
+        if "perft" in options:
+            self.perft(max(1, options["perft"]))
+            return
+
+        movetime = options["movetime"] / 1000 if "movetime" in options else self.allocate_time(options)
+        self.thread = threading.Thread(target=self.think,
+                                       args=(options.get("depth"), options.get("nodes"), movetime), daemon=True)
+        self.thread.start()
+
+    def allocate_time(self, options: dict[str, int]) -> float | None:
+        """
+        Seconds to spend on the move from the clock of the side to move, None without a clock.
+        """
+        side = "wb"[self.chess.turn]
+        if f"{side}time" not in options:
+            return None
+        remaining = options[f"{side}time"] / 1000
+        increment = options.get(f"{side}inc", 0) / 1000
+        share = remaining / options.get("movestogo", DEFAULT_MOVES_TO_GO) + increment * 0.8
+        # always leave some time on the clock
+        return max(0.01, min(share, remaining / 2))
+
+    def think(self, depth: int | None, nodes: int | None, movetime: float | None) -> None:
+        best_move, _ = self.search.search(depth, nodes, movetime, info=self.send)
+        self.send(f"bestmove {move_to_string(best_move) if best_move is not None else '0000'}")
+
+    def perft(self, depth: int) -> None:
+        start = time.perf_counter()
+        results = divide(self.chess, depth)
+        for move, count in results.items():
+            self.send(f"{move}: {count}")
+        total = sum(results.values())
+        elapsed = time.perf_counter() - start
+        self.send("")
+        self.send(f"Nodes searched: {total}")
+        self.send(f"info string time {int(elapsed * 1000)} nps {int(total / elapsed) if elapsed else 0}")
+
+    def stop(self) -> None:
+        """
+        End a running search and wait for its bestmove.
+        """
+        thread = self.thread
+        while thread and thread.is_alive():
+            # set again until the thread ends, a search that was just starting clears the flag
+            self.search.stopped = True
+            thread.join(0.01)
+        self.thread = None
+
+
+if __name__ == "__main__":
+    UCIEngine().loop()
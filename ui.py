@@ -2,11 +2,12 @@ import pyglet
 from pyglet.text import Label
 from pyglet.image import AbstractImage, load
 from pyglet.sprite import Sprite
-from pyglet.window import Window, mouse
+from pyglet.window import Window, mouse, key
 from pyglet.shapes import Rectangle, Circle, Arc
 from pyglet.graphics import Batch
 
 from chess_cli import Chess, Piece, Pawn, position_to_notation, notation_to_position, FILES, RANKS
+from bitboard import iter_squares, square_position
 
 
 class ChessUI:
@@ -51,6 +52,7 @@ class ChessUI:
         self.window.on_mouse_press = self.on_mouse_press
         self.window.on_mouse_release = self.on_mouse_release
         self.window.on_mouse_drag = self.on_mouse_drag
+        self.window.on_key_press = self.on_key_press
 
     def create_squares(self):
         """
@@ -207,12 +209,9 @@ class ChessUI:
         """
         Highlight selected and possible move squares.
         """
-        ms = []
         highlight_color = (150, 20, 30)  # Red highlight
-        for sourse, moves in self.game.attacked_squares.items():
-            ms += moves
-        for move in list(set(ms)):
-            row, col = move
+        for square in iter_squares(self.game.attacked_squares):
+            row, col = square_position(square)
             rect = Circle(
                 x=(col + .5) * self.square_size,
                 # Reverse row for graphical representation
@@ -238,7 +237,7 @@ class ChessUI:
         )
 
         castling_label = Label(
-            f"Castling: {'K' if self.game.castling[0] else ''}{'Q' if self.game.castling[1] else ''}{'k' if self.game.castling[2] else ''}{'q' if self.game.castling[3] else ''}",
+            f"Castling: {self.game.castling_rights}",
             font_name="Arial",
             font_size=20,
             x=810,
@@ -316,7 +315,8 @@ class ChessUI:
                 self.selected_sprite.update(
                     x-self.selected_sprite.width/2, y-self.selected_sprite.width/2)
                 if piece.color == self.game.colors[self.game.turn]:
-                    self.highlighted_squares = set([move[:2] for move in piece.possible_moves])
+                    self.highlighted_squares = set(
+                        [notation_to_position(move[2:4]) for move in self.game.legal_moves if move[:2] == self.source_sq])
 
     def on_mouse_release(self, x, y, button, modifiers):
         if button == mouse.LEFT:
@@ -348,6 +348,22 @@ class ChessUI:
                 self.selected_sprite.update(
                     x-self.selected_sprite.width/2, y-self.selected_sprite.width/2)
 
+    def on_key_press(self, symbol, modifiers):
+        """
+        P toggles the move generation profiler and prints its report when it is turned off,
+        R prints the report and resets the counters.
+        """
+        profiler = self.game.profiler
+        if symbol == key.P:
+            if profiler and profiler.enabled:
+                self.game.disable_profiling()
+                print(self.game.profile_report())
+            else:
+                self.game.enable_profiling()
+        elif symbol == key.R and profiler:
+            print(self.game.profile_report())
+            self.game.reset_profile()
+
     def run(self):
         pyglet.app.run()
 
@@ -1,14 +1,93 @@
 FILES = "abcdefgh"
 RANKS = "87654321"
 
+# Lookup tables, built once at import. Squares are indexed row * 8 + col,
+# so a8 is 0 and h1 is 63 (see bitboard.py).
+
+# square index <-> notation
+SQUARE_NAMES: list[str] = [f"{f}{r}" for r in RANKS for f in FILES]
+SQUARES: dict[str, int] = {name: square for square,
+                           name in enumerate(SQUARE_NAMES)}
+
+# (row, col) steps of the eight ray directions and their square index offsets
+DIRECTIONS: list[tuple[int, int]] = [
+    (-1, 0), (1, 0),  # Vertical: up, down
+    (0, -1), (0, 1),  # Horizontal: left, right
+    (-1, -1), (-1, 1),  # Diagonal: top-left, top-right
+    (1, -1), (1, 1)    # Diagonal: bottom-left, bottom-right
+]
+DIRECTION_STEPS: list[int] = [dr * 8 + dc for dr, dc in DIRECTIONS]
+ROOK_DIRECTIONS: list[int] = [0, 1, 2, 3]
+BISHOP_DIRECTIONS: list[int] = [4, 5, 6, 7]
+KNIGHT_STEPS: list[tuple[int, int]] = [
+    (-2, -1), (-2, 1),  # Two up, one left/right
+    (-1, -2), (-1, 2),  # One up, two left/right
+    (1, -2), (1, 2),    # One down, two left/right
+    (2, -1), (2, 1)     # Two down, one left/right
+]
+
+
+def _step_targets(square: int, steps: list[tuple[int, int]]) -> int:
+    row, col = square >> 3, square & 7
+    targets = 0
+    for dr, dc in steps:
+        if 0 <= row + dr < 8 and 0 <= col + dc < 8:
+            targets |= 1 << ((row + dr) * 8 + col + dc)
+    return targets
+
+
+def _ray(square: int, direction: tuple[int, int]) -> int:
+    row, col = (square >> 3) + direction[0], (square & 7) + direction[1]
+    ray = 0
+    while 0 <= row < 8 and 0 <= col < 8:
+        ray |= 1 << (row * 8 + col)
+        row, col = row + direction[0], col + direction[1]
+    return ray
+
+
+# target bitboards per square
+KNIGHT_ATTACKS: list[int] = [_step_targets(sq, KNIGHT_STEPS) for sq in range(64)]
+KING_ATTACKS: list[int] = [_step_targets(sq, DIRECTIONS) for sq in range(64)]
+# PAWN_ATTACKS[side][square], white (0) captures towards row 0
+PAWN_ATTACKS: list[list[int]] = [
+    [_step_targets(sq, [(-1, -1), (-1, 1)]) for sq in range(64)],
+    [_step_targets(sq, [(1, -1), (1, 1)]) for sq in range(64)],
+]
+
+# RAYS[direction][square]: every square from `square` to the edge of the board
+RAYS: list[list[int]] = [[_ray(sq, d) for sq in range(64)] for d in DIRECTIONS]
+# every square on a rank or file (ROOK_LINES), diagonal (BISHOP_LINES) or any line (LINES) through a square
+ROOK_LINES: list[int] = [0] * 64
+BISHOP_LINES: list[int] = [0] * 64
+for _sq in range(64):
+    for _d in ROOK_DIRECTIONS:
+        ROOK_LINES[_sq] |= RAYS[_d][_sq]
+    for _d in BISHOP_DIRECTIONS:
+        BISHOP_LINES[_sq] |= RAYS[_d][_sq]
+del _d, _sq
+LINES: list[int] = [ROOK_LINES[sq] | BISHOP_LINES[sq] for sq in range(64)]
+
+# BETWEEN[a][b]: squares strictly between a and b on a shared line, 0 when not aligned
+BETWEEN: list[list[int]] = [[0] * 64 for _ in range(64)]
+for _a in range(64):
+    for _d, _step in enumerate(DIRECTION_STEPS):
+        _between = 0
+        _square = _a
+        _ray_bits = RAYS[_d][_a]
+        while _ray_bits:
+            _square += _step
+            BETWEEN[_a][_square] = _between
+            _between |= 1 << _square
+            _ray_bits &= ~(1 << _square)
+del _a, _d, _step, _between, _square, _ray_bits
+
 
 def notation_to_position(notation: str) -> tuple[int, int]:
     """
     Convert a chess notation like 'e4' to (4, 4) (row, col).
     """
-    col = FILES.index(notation[0])
-    row = RANKS.index(notation[1])
-    return (row, col)
+    square = SQUARES[notation[:2]]
+    return (square >> 3, square & 7)
 
 
 def position_to_notation(position: tuple[int, int]) -> str:
@@ -16,4 +95,4 @@ def position_to_notation(position: tuple[int, int]) -> str:
     Convert a chess position like (4, 4) (row, col) to 'e4'.
     """
     # position is (row, col) -> (ranks, files)
-    return f"{FILES[position[1]]}{RANKS[position[0]]}"
+    return SQUARE_NAMES[position[0] * 8 + position[1]]
@@ -0,0 +1,53 @@
+import random
+
+from bitboard import Board, iter_squares
+
+# Fixed seed so that hashes are the same in every process and every run.
+_random = random.Random(0x5EED)
+
+# PIECE_KEYS[bitboard index][square]
+PIECE_KEYS: list[list[int]] = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+# xored in when black is to move
+SIDE_KEY: int = _random.getrandbits(64)
+# one key per castling right, bit i of Chess.castling (K, Q, k, q)
+CASTLING_RIGHT_KEYS: list[int] = [_random.getrandbits(64) for _ in range(4)]
+# en passant keys by file
+EP_KEYS: list[int] = [_random.getrandbits(64) for _ in range(8)]
+
+# CASTLING_KEYS[mask]: combined key for every set of castling rights, bit i is right i
+CASTLING_KEYS: list[int] = [0] * 16
+for _mask in range(16):
+    for _right in range(4):
+        if _mask >> _right & 1:
+            CASTLING_KEYS[_mask] ^= CASTLING_RIGHT_KEYS[_right]
+del _mask, _right
+
+
+def ep_key(ep_square: int | None) -> int:
+    return 0 if ep_square is None else EP_KEYS[ep_square & 7]
+
+
+def compute_hash(board: Board, turn: int, castling: int, ep_square: int | None) -> int:
+    """
+    Zobrist hash of a position computed from scratch.
+    """
+    h = 0
+    for index, bitboard in enumerate(board.bitboards):
+        for square in iter_squares(bitboard):
+            h ^= PIECE_KEYS[index][square]
+    if turn:
+        h ^= SIDE_KEY
+    return h ^ CASTLING_KEYS[castling] ^ ep_key(ep_square)
+
+
+# rough memory of one field of a table entry: a list slot plus the python int it points to
+SLOT_SIZE = 32
+
+
+def table_mask(size_mb: int, entry_size: int) -> int:
+    """
+    Index mask of a table of hash-keyed entries fitting in `size_mb`. The entry count is
+    rounded down to a power of two, so that the index of a key is `key & mask`.
+    """
+    entries = max(1, size_mb * 1024 * 1024 // entry_size)
+    return (1 << (entries.bit_length() - 1)) - 1